@@ -1,3 +1,8 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
 def validate_data(record):
 
     errors=[]
@@ -44,3 +49,154 @@ def validate_data(record):
 
     return errors
 
+
+
+# Batch validation: the same rules evaluated over whole columns at once
+QUARANTINE_FOLDER = 'quarantine'
+QUARANTINE_FILE = 'validation_failures.jsonl'
+POLICIES = ('drop', 'quarantine', 'fail')
+RULE_COLUMNS = ('EVENT_NO_TRIP', 'ACT_TIME', 'GPS_LATITUDE', 'GPS_LONGITUDE', 'GPS_SATELLITES')
+
+def numeric_column(values):
+    """Converts a column to a float array with NaN for nulls."""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+class RecordColumns(dict):
+    """{name: list of values} pulled out of a list of dicts.
+
+    missing maps each field that some records lack to those records' indexes,
+    since a lacking field and a None value both read as None in the lists.
+    """
+
+def record_columns(records, names=RULE_COLUMNS):
+    """Pulls the named fields out of a list of dicts as RecordColumns, one pass per field.
+
+    Built once, the same columns can feed the transformations and validate_batch.
+    Records that lack a field get None in its list and are listed in missing.
+    """
+    columns = RecordColumns()
+    columns.missing = {}
+    for name in names:
+        values = [record.get(name) for record in records]
+        columns[name] = values
+        # Only a column with a None in it can have records lacking the field
+        if None in values:
+            absent = [index for index, record in enumerate(records) if name not in record]
+            if absent:
+                columns.missing[name] = absent
+    return columns
+
+def extract_columns(records):
+    """Returns ({column: float array}, {column: bool array of rows lacking it}) for the rule columns.
+
+    Takes a DataFrame, a {name: values} mapping (such as RecordColumns) or a
+    list of dicts. Fields absent everywhere become all-NaN columns.
+    """
+    if not isinstance(records, (pd.DataFrame, dict)):
+        records = record_columns(records)
+    rows = len(records) if isinstance(records, pd.DataFrame) else len(next(iter(records.values()), []))
+    row_missing = getattr(records, 'missing', {})
+    columns, missing = {}, {}
+    for name in RULE_COLUMNS:
+        if name in records:
+            columns[name] = numeric_column(records[name])
+            missing[name] = np.zeros(len(columns[name]), dtype=bool)
+            missing[name][row_missing.get(name, [])] = True
+        else:
+            columns[name] = np.full(rows, np.nan)
+            missing[name] = np.ones(rows, dtype=bool)
+    return columns, missing
+
+def find_violations(columns, missing, rows):
+    """Returns {rule message: row indexes} for every rule that has violations.
+
+    columns holds every rule column as a float array (NaN for nulls) and
+    missing the rows lacking each field, as built by extract_columns.
+    """
+    violations = {}
+
+    def flag(message, mask):
+        indexes = np.flatnonzero(mask)
+        if len(indexes):
+            violations[message] = indexes
+
+    flag("Missing EVENT_NO_TRIP", missing['EVENT_NO_TRIP'])
+    flag("Missing GPS_LATITUDE for GPS_LONGITUDE", ~missing['GPS_LONGITUDE'] & missing['GPS_LATITUDE'])
+    flag("Missing GPS_SATELLITES", missing['GPS_SATELLITES'])
+    flag("Missing GPS_LATITUDE", missing['GPS_LATITUDE'])
+    flag("Missing GPS_LONGITUDE", missing['GPS_LONGITUDE'])
+
+    # Comparisons against NaN are False, so nulls and missing fields are skipped just like validate_data skips them
+    with np.errstate(invalid='ignore'):
+        flag("GPS_SATELLITES value must be greater than or equal to zero", columns['GPS_SATELLITES'] < 0)
+        act_time = columns['ACT_TIME']
+        flag("ACT_TIME value must be less than 86399 (maximum seconds in a day)", act_time >= 86399)
+        flag("ACT_TIME value must not be negative", act_time < 0)
+        if rows > 1:
+            # Readings within a trip must not go back in time
+            order = np.argsort(columns['EVENT_NO_TRIP'], kind='stable')
+            trips, times = columns['EVENT_NO_TRIP'][order], act_time[order]
+            decreasing = np.zeros(rows, dtype=bool)
+            decreasing[order[1:]] = (trips[1:] == trips[:-1]) & (times[1:] < times[:-1])
+            flag("ACT_TIME must not decrease within a trip", decreasing)
+        latitude = columns['GPS_LATITUDE']
+        flag("GPS_LATITUDE value must be within the range of -90 to 90 degrees", (latitude < -90) | (latitude > 90))
+        longitude = columns['GPS_LONGITUDE']
+        flag("GPS_LONGITUDE value must be within the range of -180 to 180 degrees", (longitude < -180) | (longitude > 180))
+
+    return violations
+
+def quarantine_rows(records, bad_rows, violations, quarantine_file):
+    """Appends the rejected rows, with the rules they broke, to quarantine_file."""
+    rules_by_row = {}
+    for message, indexes in violations.items():
+        for index in indexes:
+            rules_by_row.setdefault(int(index), []).append(message)
+    if isinstance(records, pd.DataFrame):
+        rejected = json.loads(records.iloc[bad_rows].to_json(orient='records'))
+    else:
+        rejected = [records[index] for index in bad_rows]
+    os.makedirs(os.path.dirname(quarantine_file) or '.', exist_ok=True)
+    with open(quarantine_file, 'a') as file:
+        for index, record in zip(bad_rows, rejected):
+            file.write(json.dumps({"errors": rules_by_row[int(index)], "record": record}) + "\n")
+
+def validate_batch(records, policy='drop', columns=None, quarantine_file=None):
+    """Validates a list of records (or a DataFrame) column-wise.
+
+    Returns (valid_records, violations), where valid_records has the same type
+    as `records` and violations maps each broken rule to its row indexes.
+    Policies: 'drop' filters bad rows out, 'quarantine' also appends them to
+    quarantine_file (default QUARANTINE_FOLDER/QUARANTINE_FILE), 'fail' raises
+    ValueError if any row is bad. For a list of dicts, pass the record_columns
+    already built for it as `columns` to skip pulling the fields out again.
+
+    The rules run over whole columns, which is many times faster than
+    validate_data on a DataFrame. A list of dicts first has to be pulled
+    apart field by field in Python, which costs about as much as validate_data
+    itself, so there batch validation is only worth it when the columns are
+    shared with the transformations, as the publisher does.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown validation policy: {policy}")
+    violations = find_violations(*extract_columns(records if columns is None else columns), len(records))
+    if not violations:
+        return records, violations
+
+    if policy == 'fail':
+        counts = ", ".join(f"{message}: {len(indexes)}" for message, indexes in violations.items())
+        raise ValueError(f"Validation failed ({counts})")
+
+    bad = np.zeros(len(records), dtype=bool)
+    for indexes in violations.values():
+        bad[indexes] = True
+    if policy == 'quarantine':
+        quarantine_rows(records, np.flatnonzero(bad), violations,
+                        quarantine_file or os.path.join(QUARANTINE_FOLDER, QUARANTINE_FILE))
+
+    if isinstance(records, pd.DataFrame):
+        return records[~bad], violations
+    return [record for record, rejected in zip(records, bad) if not rejected], violations
@@ -0,0 +1,1509 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmarks for the pipeline scripts. Run with: python3 benchmarks.py <name> [args...]
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """Serves a small fixed breadcrumb list for any path, after an artificial latency."""
+    latency = 0.05
+    body = json.dumps([{"EVENT_NO_TRIP": 1, "ACT_TIME": 0, "METERS": 0}]).encode("utf-8")
+    hits = 0
+
+    def do_GET(self):
+        StubAPIHandler.hits += 1
+        time.sleep(self.latency)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(self.body)))
+            self.end_headers()
+            self.wfile.write(self.body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client was killed mid-request
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_api():
+    """Starts the stub API on a free local port and returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_fetch():
+    """Shows collector run time tracking the rate limit rather than the vehicle count."""
+    from fetch_engine import fetch_vehicles
+
+    server, base_url = start_stub_api()
+    url_template = base_url + "/api/getBreadCrumbs?vehicle_id={vehicle_id}"
+    print(f"{'vehicles':>8} {'rate/s':>7} {'seconds':>8} {'expected':>9}")
+    for vehicles in (50, 100, 200):
+        for rate in (10, 25, 50):
+            start = time.perf_counter()
+            for _ in fetch_vehicles(range(vehicles), url_template, lambda response: response.json(), rate=rate):
+                pass
+            elapsed = time.perf_counter() - start
+            print(f"{vehicles:>8} {rate:>7} {elapsed:>8.2f} {vehicles / rate:>9.2f}")
+    server.shutdown()
+
+
+def synthetic_breadcrumbs(vehicle_id, count=2000, opd_date="11APR2024:00:00:00", dropout=0.0):
+    """Builds one vehicle's API-shaped breadcrumb list."""
+    import random
+    rng = random.Random(vehicle_id)
+    breadcrumbs = []
+    meters = 0
+    for i in range(count):
+        meters += rng.randint(0, 60)
+        missing = rng.random() < dropout
+        breadcrumbs.append({
+            "EVENT_NO_TRIP": 200000000 + vehicle_id,
+            "EVENT_NO_STOP": 200000100 + i,
+            "OPD_DATE": opd_date,
+            "VEHICLE_ID": vehicle_id,
+            "METERS": meters,
+            "ACT_TIME": 14400 + i * 5,
+            "GPS_LONGITUDE": None if missing else -122.6 + rng.random() / 10,
+            "GPS_LATITUDE": None if missing else 45.5 + rng.random() / 10,
+            "GPS_SATELLITES": rng.randint(0, 12),
+            "GPS_HDOP": rng.random() * 2,
+        })
+    return breadcrumbs
+
+
+def measure_peak(function, *args):
+    """Runs `function` and returns (seconds, peak traced memory in MB)."""
+    import tracemalloc
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+
+def bench_snapshot(vehicles="500"):
+    """Compares peak memory of the in-memory and streaming snapshot writers on a synthetic day."""
+    import os
+    import random
+    import tempfile
+    from snapshot_writer import write_snapshot
+
+    vehicle_ids = list(range(1, int(vehicles) + 1))
+    arrival = vehicle_ids[:]
+    random.Random(0).shuffle(arrival)
+
+    def in_memory(path):
+        all_breadcrumbs = {vehicle_id: synthetic_breadcrumbs(vehicle_id) for vehicle_id in arrival}
+        all_breadcrumbs = dict(sorted(all_breadcrumbs.items()))
+        with open(path, "w") as file:
+            file.write(json.dumps(all_breadcrumbs))
+
+    def streaming(path):
+        with open(path, "w") as file:
+            write_snapshot(file, vehicle_ids, ((v, synthetic_breadcrumbs(v)) for v in arrival))
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, name) for name in ("memory.json", "streaming.json")]
+        for mode, function, path in zip(("in-memory", "streaming"), (in_memory, streaming), paths):
+            elapsed, peak = measure_peak(function, path)
+            print(f"{mode:>10}: {elapsed:6.2f}s, peak {peak:8.1f} MB")
+        with open(paths[0]) as first, open(paths[1]) as second:
+            print(f"Identical output: {first.read() == second.read()}")
+
+
+def bench_roster(runs="5"):
+    """Times a collector-style cold start that loads the roster from a warm cache."""
+    import os
+    import subprocess
+    import tempfile
+    import vehicle_roster
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    scripts = {
+        "warm cache": "import vehicle_roster; vehicle_roster.get_vehicle_ids()",
+        "pandas parse (old, network excluded)": f"import pandas as pd; pd.read_csv('{vehicle_roster.CACHE_FILE}')['Doodle'].tolist()",
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, vehicle_roster.CACHE_FILE), "w") as file:
+            file.write("Doodle\n" + "\n".join(str(2900 + i) for i in range(300)) + "\n")
+        with open(os.path.join(folder, vehicle_roster.CACHE_META_FILE), "w") as file:
+            json.dump({"fetched_at": time.time()}, file)
+        env = dict(os.environ, PYTHONPATH=repo)
+        for label, script in scripts.items():
+            start = time.perf_counter()
+            for _ in range(int(runs)):
+                subprocess.run([sys.executable, "-c", script], cwd=folder, env=env, check=True)
+            print(f"{label}: {(time.perf_counter() - start) / int(runs) * 1000:.0f} ms per start")
+
+
+CHECKPOINT_CHILD = """
+import sys
+from fetch_engine import fetch_vehicles
+from collection_checkpoint import CollectionCheckpoint
+from snapshot_writer import write_snapshot
+
+url_template, vehicle_ids = sys.argv[1], list(range(int(sys.argv[2])))
+checkpoint = CollectionCheckpoint("TriMet__bench.json")
+for vehicle_id, payload in fetch_vehicles(checkpoint.pending(vehicle_ids), url_template, lambda r: r.json(), rate=20):
+    if payload is not None:
+        checkpoint.record(vehicle_id, payload)
+with open("TriMet__bench.json", "w") as stream:
+    write_snapshot(stream, vehicle_ids, checkpoint.results(vehicle_ids), serialized=True)
+checkpoint.clear()
+"""
+
+
+def bench_checkpoint(vehicles="200"):
+    """Kills a checkpointed collection halfway through and measures what the restart re-fetches."""
+    import contextlib
+    import io
+    import os
+    import subprocess
+    import tempfile
+    from collection_checkpoint import CHECKPOINT_FOLDER
+
+    server, base_url = start_stub_api()
+    url_template = base_url + "/api/getBreadCrumbs?vehicle_id={vehicle_id}"
+    repo = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as folder:
+        env = dict(os.environ, PYTHONPATH=repo)
+        command = [sys.executable, "-c", CHECKPOINT_CHILD, url_template, vehicles]
+        journal = os.path.join(folder, CHECKPOINT_FOLDER, "TriMet__bench", "journal.jsonl")
+
+        start = time.perf_counter()
+        child = subprocess.Popen(command, cwd=folder, env=env, stderr=subprocess.DEVNULL)
+        while not os.path.exists(journal) or sum(1 for _ in open(journal)) < int(vehicles) // 2:
+            time.sleep(0.05)
+        child.kill()
+        child.wait()
+        first_hits, first_time = StubAPIHandler.hits, time.perf_counter() - start
+
+        start = time.perf_counter()
+        subprocess.run(command, cwd=folder, env=env, stderr=subprocess.DEVNULL, check=True)
+        second_hits, second_time = StubAPIHandler.hits - first_hits, time.perf_counter() - start
+        with open(os.path.join(folder, "TriMet__bench.json")) as file:
+            saved = len(json.load(file))
+    server.shutdown()
+    print(f"Killed run:    {first_hits} requests in {first_time:.2f}s")
+    print(f"Restarted run: {second_hits} requests in {second_time:.2f}s")
+    print(f"Vehicles in final file: {saved}/{vehicles}")
+
+    # Which leftover checkpoint the next run resumes: a recent one across midnight, never a stale one
+    from datetime import datetime, timedelta
+    from collection_checkpoint import DATE_FORMAT, RESUME_HOURS, CollectionCheckpoint, run_filename
+    now = datetime.now()
+    for label, day, age in (("yesterday's, written 1h ago", timedelta(days=1), timedelta(hours=1)),
+                            ("from 2 days ago", timedelta(days=2), timedelta(days=2))):
+        with tempfile.TemporaryDirectory() as folder:
+            name = f"TriMet__{(now - day).strftime(DATE_FORMAT)}"
+            checkpoint = CollectionCheckpoint(f"{name}.json", folder)
+            checkpoint.record(1, [])
+            stamp = (now - age).timestamp()
+            os.utime(checkpoint.journal_path, (stamp, stamp))
+            os.utime(checkpoint.folder, (stamp, stamp))
+            with contextlib.redirect_stdout(io.StringIO()):
+                filename = run_filename("TriMet__", folder)
+            resumed = filename == f"{name}.json"
+            today = filename == f"TriMet__{now.strftime(DATE_FORMAT)}.json"
+            print(f"Checkpoint {label:>27} (resume window {RESUME_HOURS}h): "
+                  f"{'resumed' if resumed else 'fresh run for today' if today else 'WRONG ' + filename}, "
+                  f"left in place: {os.path.isdir(checkpoint.folder)}")
+
+
+STOP_EVENT_COLUMNS = [
+    "vehicle_number", "leave_time", "train", "route_number", "direction", "service_key",
+    "trip_number", "stop_time", "arrive_time", "dwell", "location_id", "door", "lift", "ons",
+    "offs", "estimated_load", "maximum_speed", "train_mileage", "pattern_distance",
+    "location_distance", "x_coordinate", "y_coordinate", "data_source", "schedule_status",
+]
+
+
+def synthetic_stop_events_page(vehicle_id, trips=12, stops=60):
+    """Builds a getStopEvents-shaped HTML page."""
+    parts = [f"<html><head><title>Stop events</title></head><body><h1>Stop events for vehicle {vehicle_id}</h1>"]
+    for trip in range(trips):
+        parts.append(f"<h2>Stop events for PDX_TRIP {230000000 + vehicle_id * 100 + trip}</h2>\n<table border=\"1\">")
+        parts.append("<tr>" + "".join(f"<th>{column}</th>" for column in STOP_EVENT_COLUMNS) + "</tr>")
+        for stop in range(stops):
+            cells = [str(vehicle_id), str(20000 + stop * 60), "2", "8", "1", "W", str(trip), str(19990 + stop * 60),
+                     str(19995 + stop * 60), "5", str(1000 + stop), "0", "0", "1", "0", "12", "25.4", "3.21",
+                     str(stop * 300), "0", "7654321.1", "654321.9", "0", "1"]
+            parts.append("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+        parts.append("</table>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def legacy_convert_html_to_json(html_text):
+    """The BeautifulSoup implementation the collector used before stop_events_parser."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_text, 'lxml')
+    data = []
+    for trip in soup.find_all('h2'):
+        table = trip.find_next('table')
+        headings = [th.text for th in table.find_all('th')]
+        rows_data = [dict(zip(headings, [td.text for td in row.find_all('td')])) for row in table.find_all('tr')[1:]]
+        data.append({'trip': trip.text.strip(), 'data': rows_data})
+    return json.dumps(data, indent=4)
+
+
+def bench_stop_events_parser(pages_folder=None):
+    """Compares the event-based stop events parser with the BeautifulSoup version on the same pages."""
+    import os
+    from stop_events_parser import parse_stop_events
+
+    if pages_folder:
+        pages = []
+        for name in sorted(os.listdir(pages_folder)):
+            with open(os.path.join(pages_folder, name), "r") as file:
+                pages.append(file.read())
+    else:
+        pages = [synthetic_stop_events_page(vehicle_id) for vehicle_id in range(20)]
+    megabytes = sum(len(page) for page in pages) / (1024 * 1024)
+
+    start = time.perf_counter()
+    legacy = [json.loads(legacy_convert_html_to_json(page)) for page in pages]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = [parse_stop_events(page) for page in pages]
+    parsed_time = time.perf_counter() - start
+
+    print(f"{len(pages)} pages, {megabytes:.1f} MB")
+    print(f"BeautifulSoup: {legacy_time:6.2f}s ({megabytes / legacy_time:6.2f} MB/s)")
+    print(f"Event parser:  {parsed_time:6.2f}s ({megabytes / parsed_time:6.2f} MB/s)")
+    print(f"Identical output: {legacy == parsed}")
+
+
+class FakeMessage:
+    def __init__(self, data):
+        self.data = data
+        self.acked = False
+
+    def ack(self):
+        self.acked = True
+
+
+def bench_receiver(messages="200000"):
+    """Compares the in-memory receiver with SpillBuffer on a synthetic, shuffled message stream."""
+    import os
+    import random
+    import tempfile
+    from breadcrumb_spill import SpillBuffer
+
+    count = int(messages)
+    per_vehicle = 2000
+    payloads = [json.dumps(record).encode("utf-8") for vehicle_id in range(count // per_vehicle)
+                for record in synthetic_breadcrumbs(vehicle_id, per_vehicle)]
+    random.Random(0).shuffle(payloads)
+
+    def in_memory(output):
+        grouped = {}
+        for data in payloads:
+            message = json.loads(FakeMessage(data).data.decode("utf-8"))
+            grouped.setdefault(message["VEHICLE_ID"], []).append(message)
+        for vehicle_id in grouped:
+            grouped[vehicle_id].sort(key=lambda x: x["ACT_TIME"])
+        output.write(json.dumps({k: grouped[k] for k in sorted(grouped)}))
+
+    def spilled(output, folder):
+        spill_buffer = SpillBuffer(folder, max_messages=10000)
+        for data in payloads:
+            message = FakeMessage(data)
+            spill_buffer.add(message, [json.loads(message.data.decode("utf-8"))])
+        spill_buffer.close()
+        spill_buffer.merge(output, spill_buffer.days()[0])
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, name) for name in ("memory.json", "spilled.json")]
+        with open(paths[0], "w") as output:
+            elapsed, peak = measure_peak(in_memory, output)
+        print(f"In-memory: {elapsed:6.2f}s, peak {peak:8.1f} MB")
+        with open(paths[1], "w") as output:
+            elapsed, peak = measure_peak(spilled, output, os.path.join(folder, "spill"))
+        print(f"Spilled:   {elapsed:6.2f}s, peak {peak:8.1f} MB")
+        with open(paths[0]) as first, open(paths[1]) as second:
+            print(f"Identical output: {first.read() == second.read()}")
+
+
+def bench_publish(breadcrumbs="100000"):
+    """Compares per-breadcrumb messages with packed (and compressed) ones.
+
+    With PUBSUB_EMULATOR_HOST set, the messages are also published to a topic on
+    the emulator to measure messages/s and bytes/s end to end.
+    """
+    import os
+    from breadcrumb_codec import decode_message, encode_breadcrumbs
+
+    per_vehicle = 2000
+    vehicles = [synthetic_breadcrumbs(vehicle_id, per_vehicle) for vehicle_id in range(int(breadcrumbs) // per_vehicle)]
+    modes = {
+        "one per breadcrumb": lambda crumbs: [(json.dumps(c).encode("utf-8"), {}) for c in crumbs],
+        "packed jsonl": lambda crumbs: [encode_breadcrumbs(crumbs[i:i + 1000], compress=False) for i in range(0, len(crumbs), 1000)],
+        "packed jsonl+zlib": lambda crumbs: [encode_breadcrumbs(crumbs[i:i + 1000]) for i in range(0, len(crumbs), 1000)],
+    }
+    publisher = None
+    if os.environ.get("PUBSUB_EMULATOR_HOST"):
+        from google.cloud import pubsub_v1
+        from publish_breadcrumb_messages import BATCH_SETTINGS, FLOW_CONTROL
+        publisher = pubsub_v1.PublisherClient(BATCH_SETTINGS, publisher_options=pubsub_v1.types.PublisherOptions(flow_control=FLOW_CONTROL))
+        topic_path = publisher.topic_path("bench-project", "bench-topic")
+        try:
+            publisher.create_topic(name=topic_path)
+        except Exception:
+            pass  # Already exists
+
+    for mode, encode in modes.items():
+        start = time.perf_counter()
+        messages = [message for crumbs in vehicles for message in encode(crumbs)]
+        encode_time = time.perf_counter() - start
+        size = sum(len(data) for data, _ in messages)
+        decoded = [crumb for data, attributes in messages for crumb in decode_message(data, attributes)]
+        assert decoded == [crumb for crumbs in vehicles for crumb in crumbs]
+        line = f"{mode:>20}: {len(messages):>7} messages, {size / (1024 * 1024):7.2f} MB, encoded in {encode_time:5.2f}s"
+        if publisher is not None:
+            start = time.perf_counter()
+            futures = [publisher.publish(topic_path, data, **attributes) for data, attributes in messages]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+            line += f", published {len(messages) / elapsed:9.0f} msg/s {size / elapsed / (1024 * 1024):6.2f} MB/s"
+            line += f" ({len(decoded) / elapsed:9.0f} breadcrumbs/s)"
+        print(line)
+
+
+def bench_transformations(breadcrumbs="100000"):
+    """Compares per-record pandas transformations with the vectorized batch versions."""
+    import pandas as pd
+    from transformations import calculate_speeds, decode_timestamps
+
+    per_vehicle = 2000
+    vehicles = [synthetic_breadcrumbs(vehicle_id, per_vehicle) for vehicle_id in range(int(breadcrumbs) // per_vehicle)]
+
+    def per_record(crumbs):
+        speeds, timestamps = [None], []
+        for previous, current in zip(crumbs, crumbs[1:]):
+            time_difference = current['ACT_TIME'] - previous['ACT_TIME']
+            speeds.append((current['METERS'] - previous['METERS']) / time_difference if time_difference != 0 else 0)
+        for crumb in crumbs:
+            opd_date = pd.to_datetime(crumb['OPD_DATE'], format='%d%b%Y:%H:%M:%S')
+            timestamps.append(str(opd_date + pd.to_timedelta(crumb['ACT_TIME'], unit='s')))
+        return speeds, timestamps
+
+    start = time.perf_counter()
+    expected = [per_record(crumbs) for crumbs in vehicles]
+    per_record_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [(calculate_speeds(crumbs), decode_timestamps(crumbs)) for crumbs in vehicles]
+    batch_time = time.perf_counter() - start
+
+    rows = len(vehicles) * per_vehicle
+    print(f"Per-record: {per_record_time:6.2f}s ({per_record_time / rows * 1e6:6.2f} us/row)")
+    print(f"Vectorized: {batch_time:6.2f}s ({batch_time / rows * 1e6:6.2f} us/row)")
+    print(f"Identical output: {expected == actual}")
+
+
+def bench_validation(rows="1000000"):
+    """Compares per-record validate_data with columnar validate_batch."""
+    import numpy as np
+    import pandas as pd
+    from assertions import validate_batch, validate_data
+
+    rows = int(rows)
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "EVENT_NO_TRIP": np.arange(rows) // 500,
+        "ACT_TIME": 14400 + (np.arange(rows) % 500) * 5,
+        "GPS_LATITUDE": 45.5 + rng.random(rows) / 10,
+        "GPS_LONGITUDE": -122.6 + rng.random(rows) / 10,
+        "GPS_SATELLITES": rng.integers(-1, 12, rows),
+    })
+    records = frame.to_dict("records")
+
+    start = time.perf_counter()
+    expected_bad = sum(1 for record in records if validate_data(record))
+    per_record_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kept, violations = validate_batch(frame, policy="drop")
+    frame_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    validate_batch(records, policy="drop")
+    records_time = time.perf_counter() - start
+
+    print(f"Per-record validate_data:    {per_record_time:6.2f}s")
+    print(f"validate_batch (DataFrame):  {frame_time:6.2f}s ({per_record_time / frame_time:5.1f}x)")
+    print(f"validate_batch (dict list):  {records_time:6.2f}s ({per_record_time / records_time:5.1f}x)")
+    print(f"Rows rejected: {rows - len(kept)} (validate_data flagged {expected_bad})")
+    for message, indexes in violations.items():
+        print(f"  {message}: {len(indexes)}")
+
+    # Records lacking a field are rejected one by one, as validate_data does, even when others in the batch have it
+    from assertions import RULE_COLUMNS
+    gappy = [dict(record) for record in records[:100000]]
+    for record, name in zip(gappy, rng.choice(RULE_COLUMNS + (None,) * 45, len(gappy))):
+        record.pop(name, None)
+    kept = validate_batch(gappy, policy="drop")[0]
+    expected = [record for record in gappy if not validate_data(record)]
+    print(f"Records lacking a field: {len(gappy) - len(kept)} of {len(gappy)} rejected, "
+          f"same as validate_data: {kept == expected}")
+
+    # What the publisher does per vehicle: API-shaped dicts in, transformations plus validation
+    from assertions import record_columns
+    from transformations import calculate_speeds, decode_timestamps
+    vehicles = [json.loads(json.dumps(synthetic_breadcrumbs(vehicle_id, 2000, dropout=0.02)))
+                for vehicle_id in range(max(1, rows // 2000))]
+
+    def per_record(breadcrumbs):
+        calculate_speeds(breadcrumbs), decode_timestamps(breadcrumbs)
+        return [breadcrumb for breadcrumb in breadcrumbs if not validate_data(breadcrumb)]
+
+    def batch_on_dicts(breadcrumbs):
+        calculate_speeds(breadcrumbs), decode_timestamps(breadcrumbs)
+        return validate_batch(breadcrumbs, policy="drop")[0]
+
+    def shared_columns(breadcrumbs):
+        columns = record_columns(breadcrumbs, RULE_COLUMNS + ("METERS", "OPD_DATE"))
+        calculate_speeds(columns), decode_timestamps(columns)
+        return validate_batch(breadcrumbs, policy="drop", columns=columns)[0]
+
+    print(f"Publisher path, {len(vehicles)} vehicles of 2000 dicts:")
+    results = {}
+    for label, function in (("per-record validate_data", per_record), ("validate_batch on dicts", batch_on_dicts),
+                            ("columns built once", shared_columns)):
+        start = time.perf_counter()
+        results[label] = [function(breadcrumbs) for breadcrumbs in vehicles]
+        print(f"  {label + ':':26} {time.perf_counter() - start:6.2f}s")
+    print(f"  Same rows kept: {len(set(map(str, results.values()))) == 1}")
+
+
+def legacy_impute_gps_coordinates(events):
+    """The quadratic imputation json_cleanup used before the two-pass version."""
+    for i, event in enumerate(events):
+        if event['GPS_LONGITUDE'] is None or event['GPS_LATITUDE'] is None:
+            prev_event = None
+            next_event = None
+            for j in range(i - 1, -1, -1):
+                if events[j]['GPS_LONGITUDE'] is not None and events[j]['GPS_LATITUDE'] is not None:
+                    prev_event = events[j]
+                    break
+            for k in range(i + 1, len(events)):
+                if events[k]['GPS_LONGITUDE'] is not None and events[k]['GPS_LATITUDE'] is not None:
+                    next_event = events[k]
+                    break
+            if prev_event and next_event:
+                time_ratio = (event['ACT_TIME'] - prev_event['ACT_TIME']) / (next_event['ACT_TIME'] - prev_event['ACT_TIME'])
+                event['GPS_LONGITUDE'] = prev_event['GPS_LONGITUDE'] + time_ratio * (next_event['GPS_LONGITUDE'] - prev_event['GPS_LONGITUDE'])
+                event['GPS_LATITUDE'] = prev_event['GPS_LATITUDE'] + time_ratio * (next_event['GPS_LATITUDE'] - prev_event['GPS_LATITUDE'])
+            elif prev_event:
+                event['GPS_LONGITUDE'] = prev_event['GPS_LONGITUDE']
+                event['GPS_LATITUDE'] = prev_event['GPS_LATITUDE']
+            elif next_event:
+                event['GPS_LONGITUDE'] = next_event['GPS_LONGITUDE']
+                event['GPS_LATITUDE'] = next_event['GPS_LATITUDE']
+            else:
+                event['GPS_LONGITUDE'] = 0
+                event['GPS_LATITUDE'] = 0
+
+
+def bench_imputation(events="20000"):
+    """Compares the two-pass GPS imputation with the quadratic one on traces with heavy dropout."""
+    import copy
+    import random
+    from json_cleanup import impute_gps_coordinates
+
+    count = int(events)
+    trace = synthetic_breadcrumbs(1, count, dropout=0.3)
+    # One long dropout in the middle of the trace
+    for event in trace[count // 4: count // 2]:
+        event["GPS_LONGITUDE"] = event["GPS_LATITUDE"] = None
+
+    legacy_trace, new_trace = copy.deepcopy(trace), copy.deepcopy(trace)
+    start = time.perf_counter()
+    legacy_impute_gps_coordinates(legacy_trace)
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    impute_gps_coordinates(new_trace)
+    new_time = time.perf_counter() - start
+    print(f"{count} events: quadratic {legacy_time:7.3f}s, two-pass {new_time:7.3f}s")
+    print(f"Identical output: {legacy_trace == new_trace}")
+
+    # Randomized comparison on short traces, skipping cases that divide by zero in the old version
+    rng = random.Random(0)
+    checked = 0
+    for _ in range(2000):
+        short = synthetic_breadcrumbs(rng.randint(1, 10**6), rng.randint(0, 30), dropout=rng.random())
+        for event in short:
+            event["ACT_TIME"] = rng.randint(0, 40)
+            if rng.random() < 0.1:
+                event["GPS_LATITUDE"] = None
+        expected, actual = copy.deepcopy(short), copy.deepcopy(short)
+        try:
+            legacy_impute_gps_coordinates(expected)
+        except ZeroDivisionError:
+            continue
+        impute_gps_coordinates(actual)
+        assert expected == actual, short
+        checked += 1
+    print(f"Randomized traces matching the old implementation: {checked}")
+
+
+def write_synthetic_corpus(folder, days, vehicles, per_vehicle, dropout=0.1):
+    """Writes TriMet__<date>.json day files shaped like the bucket snapshots."""
+    import os
+    from datetime import datetime, timedelta
+    os.makedirs(folder, exist_ok=True)
+    for day in range(days):
+        date = datetime(2024, 5, 1) + timedelta(days=day)
+        opd_date = date.strftime("%d%b%Y:00:00:00").upper()
+        snapshot = {str(vehicle_id): synthetic_breadcrumbs(vehicle_id, per_vehicle, opd_date=opd_date, dropout=dropout)
+                    for vehicle_id in range(3000, 3000 + vehicles)}
+        with open(os.path.join(folder, f"TriMet__{date:%Y-%m-%d}.json"), "w") as file:
+            json.dump(snapshot, file)
+
+
+def bench_cleaning(days="4", vehicles="60"):
+    """Times json_cleanup.clean_json_files on a synthetic multi-day corpus with 1..N workers."""
+    import os
+    import shutil
+    import tempfile
+    import json_cleanup
+
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder = os.path.join(folder, "downloaded_jsons")
+        write_synthetic_corpus(input_folder, int(days), int(vehicles), 3000)
+        json_cleanup.INPUT_FOLDER = input_folder
+        json_cleanup.OUTPUT_FOLDER = os.path.join(folder, "cleaned_jsons")
+        baseline = None
+        for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            shutil.rmtree(json_cleanup.OUTPUT_FOLDER, ignore_errors=True)
+            start = time.perf_counter()
+            json_cleanup.clean_json_files(workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"workers={workers}: {elapsed:6.2f}s ({baseline / elapsed:4.1f}x)")
+
+        # Each shard is independent, so on N free cores the run takes about as long as its slowest shard.
+        # Timing the shards one after another shows that critical path even on a machine with fewer cores.
+        file_names = sorted(os.listdir(input_folder))
+        serial = None
+        for shards in (1, 2, 4, 8):
+            shutil.rmtree(json_cleanup.OUTPUT_FOLDER, ignore_errors=True)
+            os.makedirs(json_cleanup.OUTPUT_FOLDER)
+            shard_times = []
+            for index in range(shards):
+                start = time.process_time()
+                for file_name in file_names:
+                    json_cleanup.clean_file(file_name, (index, shards))
+                shard_times.append(time.process_time() - start)
+            serial = serial or sum(shard_times)
+            print(f"shards={shards}: total CPU {sum(shard_times):6.2f}s, slowest shard {max(shard_times):6.2f}s "
+                  f"({serial / max(shard_times):4.1f}x on {shards} cores)")
+
+
+def bench_stream_reader(vehicles="200"):
+    """Compares peak memory of json.load with the streaming day-file reader."""
+    import os
+    import tempfile
+    from json_stream import iter_vehicles
+
+    def with_json_load(path):
+        with open(path, "r") as file:
+            data = json.load(file)
+        return sum(len(events) for events in data.values())
+
+    def with_stream(path):
+        return sum(len(events) for _, events in iter_vehicles(path))
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_synthetic_corpus(folder, 1, int(vehicles), 3000)
+        path = os.path.join(folder, os.listdir(folder)[0])
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f"Day file: {size:.1f} MB, largest vehicle {size / int(vehicles):.2f} MB")
+        for label, function in (("json.load", with_json_load), ("iter_vehicles", with_stream)):
+            elapsed, peak = measure_peak(function, path)
+            print(f"{label:>14}: {elapsed:6.2f}s, peak {peak:8.1f} MB")
+
+    # Values of every shape cut at every read boundary, including numbers split after '.', 'e' or a sign
+    import io
+    import random
+    from json_stream import iter_json_object
+    rng = random.Random(0)
+    scalars = [0, 7, -12, 12.5, -0.25, 3e-07, -1.5e+300, 1e21, 2.0e5, True, False, None, "", "a,b", "]}", 'q"uo\\te']
+
+    def random_value(depth=0):
+        if depth > 2 or rng.random() < 0.5:
+            return rng.choice(scalars)
+        if rng.random() < 0.5:
+            return [random_value(depth + 1) for _ in range(rng.randint(0, 3))]
+        return {f"k{i}": random_value(depth + 1) for i in range(rng.randint(0, 3))}
+
+    checked = 0
+    for _ in range(500):
+        expected = {f"v{i}": random_value() for i in range(rng.randint(0, 5))}
+        text = json.dumps(expected, separators=rng.choice([(",", ":"), (", ", ": ")]))
+        for read_size in range(1, 9):
+            assert dict(iter_json_object(io.StringIO(text), read_size)) == expected, (text, read_size)
+            checked += 1
+    print(f"Boundary cases matching json.loads: {checked}")
+
+
+def bench_cleaned_format(vehicles="60"):
+    """Compares size, write time and read-back time of the JSON and .npz cleaned formats."""
+    import os
+    import tempfile
+    import json_cleanup
+    from cleaned_format import read_npz
+
+    def read_json(path):
+        with open(path, "r") as file:
+            return json.load(file)
+
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder = os.path.join(folder, "downloaded_jsons")
+        write_synthetic_corpus(input_folder, 1, int(vehicles), 3000)
+        json_cleanup.INPUT_FOLDER = input_folder
+        for output_format, read in (("json", read_json), ("npz", read_npz)):
+            json_cleanup.OUTPUT_FOLDER = os.path.join(folder, f"cleaned_{output_format}")
+            start = time.perf_counter()
+            json_cleanup.clean_json_files(output_format=output_format)
+            write_time = time.perf_counter() - start
+            paths = [os.path.join(json_cleanup.OUTPUT_FOLDER, name) for name in os.listdir(json_cleanup.OUTPUT_FOLDER)]
+            size = sum(os.path.getsize(path) for path in paths) / (1024 * 1024)
+            start = time.perf_counter()
+            for path in paths:
+                read(path)
+            read_time = time.perf_counter() - start
+            print(f"{output_format:>5}: {size:7.2f} MB on disk, clean+write {write_time:6.2f}s, read {read_time:6.3f}s")
+
+
+def bench_timestamps(rows="200000"):
+    """Compares per-row strptime/isoformat with the cached timestamp decoder."""
+    import random
+    from datetime import datetime, timedelta
+    import pandas as pd
+    from timestamp_decoder import decode_epochs, decode_isoformats
+
+    opd_dates = ["11APR2024:00:00:00"] * int(rows)
+    # Includes trips running past midnight, which TriMet reports as ACT_TIME >= 86400
+    act_times = [random.randint(14000, 95000) for _ in range(int(rows))]
+
+    def per_row(opd_dates, act_times):
+        return [(datetime.strptime(opd_date, '%d%b%Y:%H:%M:%S') + timedelta(seconds=act_time)).isoformat()
+                for opd_date, act_time in zip(opd_dates, act_times)]
+
+    def with_pandas(opd_dates, act_times):
+        timestamps = pd.to_datetime(pd.Series(opd_dates), format='%d%b%Y:%H:%M:%S', cache=True) + pd.to_timedelta(act_times, unit='s')
+        return timestamps.dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+
+    expected = None
+    for label, function in (("strptime per row", per_row), ("pandas vectorized", with_pandas),
+                            ("decoder ISO", decode_isoformats), ("decoder epoch", decode_epochs)):
+        start = time.perf_counter()
+        result = function(opd_dates, act_times)
+        elapsed = time.perf_counter() - start
+        expected = expected or result
+        same = "" if function is decode_epochs else f", identical: {result == expected}"
+        print(f"{label:>18}: {elapsed / len(act_times) * 1e6:6.2f} us/row{same}")
+
+
+def bench_manifest(days="100", vehicles="20"):
+    """Times a no-op json_cleanup rerun with and without the processing manifest."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import json_cleanup
+
+    with tempfile.TemporaryDirectory() as folder:
+        json_cleanup.INPUT_FOLDER = os.path.join(folder, "downloaded_jsons")
+        json_cleanup.OUTPUT_FOLDER = os.path.join(folder, "cleaned_jsons")
+        write_synthetic_corpus(json_cleanup.INPUT_FOLDER, int(days), int(vehicles), 500)
+        manifest_path = json_cleanup.manifest_path()
+
+        def run():
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                json_cleanup.clean_json_files(output_format="npz")
+            return time.perf_counter() - start
+
+        print(f"First run, {days} days:        {run():6.2f}s")
+        print(f"No-op rerun with manifest:    {run():6.3f}s")
+        os.remove(manifest_path)
+        print(f"No-op rerun reading inputs:   {run():6.2f}s")
+        # A re-download with identical bytes only changes the mtime; the hash keeps it skipped
+        for name in os.listdir(json_cleanup.INPUT_FOLDER):
+            os.utime(os.path.join(json_cleanup.INPUT_FOLDER, name))
+        print(f"Rerun after touching inputs:  {run():6.3f}s")
+        print(f"Rerun after that:             {run():6.3f}s")
+
+
+class StubGCSHandler(BaseHTTPRequestHandler):
+    """Minimal GCS JSON API (object list, metadata and media download) over an in-memory bucket.
+
+    Stands in for fake-gcs-server; the storage client reaches it through
+    STORAGE_EMULATOR_HOST. Every request pays an artificial latency.
+    """
+    latency = 0.02
+    objects = {}  # name -> bytes
+    hits = 0
+
+    def metadata(self, bucket, name):
+        import base64
+        import hashlib
+        import google_crc32c
+        data = self.objects[name]
+        return {"kind": "storage#object", "bucket": bucket, "name": name, "size": str(len(data)), "generation": "1",
+                "md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode("ascii"),
+                "crc32c": base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii")}
+
+    def send(self, status, body, headers=()):
+        self.send_response(status)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        from urllib.parse import parse_qs, unquote, urlparse
+        StubGCSHandler.hits += 1
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.split("/")
+        download = parts[1] == "download"
+        if download:
+            parts = parts[1:]
+        bucket = parts[4]
+        if len(parts) == 6:
+            items = [self.metadata(bucket, name) for name in sorted(self.objects) if name.startswith(query.get("prefix", ""))]
+            return self.send(200, json.dumps({"kind": "storage#objects", "items": items}).encode("utf-8"),
+                             [("Content-Type", "application/json")])
+        name = unquote(parts[6])
+        if name not in self.objects:
+            return self.send(404, json.dumps({"error": {"code": 404, "message": "No such object"}}).encode("utf-8"),
+                             [("Content-Type", "application/json")])
+        if not download:
+            return self.send(200, json.dumps(self.metadata(bucket, name)).encode("utf-8"), [("Content-Type", "application/json")])
+        data = self.objects[name]
+        meta = self.metadata(bucket, name)
+        headers = [("Content-Type", "application/octet-stream"), ("X-Goog-Generation", "1"),
+                   ("X-Goog-Hash", f"crc32c={meta['crc32c']},md5={meta['md5Hash']}")]
+        if "Range" in self.headers:
+            start, end = self.headers["Range"].split("=")[1].split("-")
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            headers.append(("Content-Range", f"bytes {start}-{end}/{len(data)}"))
+            return self.send(206, data[start:end + 1], headers)
+        self.send(200, data, headers)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_bucket_download(days="60", size_kb="512"):
+    """Compares per-file exists()+download with the listing-driven parallel sync against a stub GCS server."""
+    import os
+    import random
+    import tempfile
+    from datetime import datetime, timedelta
+    import bucket_sync
+    import object_store
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGCSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["STORAGE_EMULATOR_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    store = object_store.get_store("bench-bucket", backend="gcs", credentials_file=None)
+    bucket = store.bucket
+
+    # Every third day is missing from the bucket, as happens when collection fails
+    names = [f"TriMet__{datetime(2024, 5, 13) + timedelta(days=day):%Y-%m-%d}.json" for day in range(int(days))]
+    StubGCSHandler.objects = {f"data/{name}": random.randbytes(int(size_kb) * 1024) for i, name in enumerate(names) if i % 3}
+
+    with tempfile.TemporaryDirectory() as folder:
+        legacy_folder = os.path.join(folder, "legacy")
+        os.makedirs(legacy_folder)
+        start, StubGCSHandler.hits = time.perf_counter(), 0
+        for name in names:
+            blob = bucket.blob(f"data/{name}")
+            if blob.exists():
+                blob.download_to_filename(os.path.join(legacy_folder, name))
+        print(f"exists()+download per file: {time.perf_counter() - start:6.2f}s, {StubGCSHandler.hits} requests")
+
+        sync_folder = os.path.join(folder, "sync")
+        for label in ("sync, first run", "sync, no-op rerun"):
+            start, StubGCSHandler.hits = time.perf_counter(), 0
+            counts = bucket_sync.sync_prefix(store, "data", sync_folder, file_names=names)
+            print(f"{label:>26}: {time.perf_counter() - start:6.2f}s, {StubGCSHandler.hits} requests, "
+                  f"(downloaded, unchanged, failed) = {counts}")
+
+        # An object replaced in the bucket with the same size is caught by its checksum
+        changed = f"data/{names[1]}"
+        StubGCSHandler.objects[changed] = random.randbytes(len(StubGCSHandler.objects[changed]))
+        counts = bucket_sync.sync_prefix(store, "data", sync_folder, file_names=names)
+        print(f"{'sync, one object changed':>26}: (downloaded, unchanged, failed) = {counts}")
+    server.shutdown()
+
+
+def bench_object_store(uploads="20", vehicles="200"):
+    """Times per-upload client creation against the cached store, then a collect/download round trip on the local backend."""
+    import os
+    import tempfile
+    import rsa
+    from google.cloud import storage
+    import bucket_sync
+    import object_store
+    import project1_data_collection
+
+    with tempfile.TemporaryDirectory() as folder:
+        # A throwaway service account key, so the client setup matches a real run
+        _, private_key = rsa.newkeys(2048)
+        key_path = os.path.join(folder, "key.json")
+        with open(key_path, "w") as file:
+            json.dump({"type": "service_account", "project_id": "bench", "private_key_id": "1",
+                       "private_key": private_key.save_pkcs1().decode("ascii"), "client_email": "bench@bench.iam.gserviceaccount.com",
+                       "client_id": "1", "token_uri": "https://oauth2.googleapis.com/token"}, file)
+        start = time.perf_counter()
+        for _ in range(int(uploads)):
+            storage.Client.from_service_account_json(key_path).bucket("bench-bucket")
+        per_call = (time.perf_counter() - start) / int(uploads)
+        start = time.perf_counter()
+        for _ in range(int(uploads)):
+            object_store.get_store("bench-bucket", backend="gcs", credentials_file=key_path)
+        cached = (time.perf_counter() - start) / int(uploads)
+        print(f"Client per upload: {per_call * 1000:7.2f} ms/upload, cached store: {cached * 1000:7.3f} ms/upload")
+
+        object_store.LOCAL_STORE_ROOT = os.path.join(folder, "local_bucket")
+        store = object_store.get_store(backend="local")
+        object_store.get_store.cache_clear()
+        object_store.BACKEND = "local"
+        vehicle_ids = list(range(3000, 3000 + int(vehicles)))
+        results = ((vehicle_id, synthetic_breadcrumbs(vehicle_id)) for vehicle_id in vehicle_ids)
+        start = time.perf_counter()
+        project1_data_collection.stream_to_gcs(vehicle_ids, results, "TriMet__2024-05-01.json")
+        upload_time = time.perf_counter() - start
+        start = time.perf_counter()
+        counts = bucket_sync.sync_prefix(store, project1_data_collection.FOLDER_NAME, os.path.join(folder, "downloaded_jsons"))
+        print(f"Local backend: collect {upload_time:5.2f}s, download {time.perf_counter() - start:5.2f}s, "
+              f"(downloaded, unchanged, failed) = {counts}")
+
+
+def bench_compression(vehicles="200"):
+    """Size, compression ratio and throughput of gzipped day files, from upload through the cleaner's reader."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import bucket_sync
+    import object_store
+    from json_stream import iter_vehicles
+    from snapshot_writer import write_snapshot
+
+    vehicle_ids = list(range(3000, 3000 + int(vehicles)))
+    store = object_store.get_store("bench-bucket", backend="memory")
+    with tempfile.TemporaryDirectory() as folder:
+        for compress in (False, True):
+            start = time.perf_counter()
+            results = ((vehicle_id, synthetic_breadcrumbs(vehicle_id)) for vehicle_id in vehicle_ids)
+            with object_store.open_text_write(store, "data/TriMet__2024-05-01.json", compress=compress) as stream:
+                write_snapshot(stream, vehicle_ids, results)
+            upload_time = time.perf_counter() - start
+            local_folder = os.path.join(folder, "gzip" if compress else "plain")
+            bucket_sync.sync_prefix(store, "data", local_folder)
+            path = os.path.join(local_folder, "TriMet__2024-05-01.json" + (object_store.GZIP_SUFFIX if compress else ""))
+            start = time.perf_counter()
+            rows = sum(len(events) for _, events in iter_vehicles(path))
+            read_time = time.perf_counter() - start
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(f"{'gzip' if compress else 'plain':>5}: {size:7.2f} MB stored, upload {upload_time:5.2f}s, "
+                  f"read {read_time:5.2f}s ({rows} rows)")
+        plain = len(store.objects["data/TriMet__2024-05-01.json"])
+        compressed = len(store.objects["data/TriMet__2024-05-01.json.gz"])
+        start = time.perf_counter()
+        with object_store.gzip.open(os.path.join(folder, "gzip", "TriMet__2024-05-01.json.gz"), "rb") as file:
+            while file.read(1 << 20):
+                pass
+        inflate = plain / (1024 * 1024) / (time.perf_counter() - start)
+        print(f"Ratio {plain / compressed:4.1f}x at gzip level {object_store.GZIP_LEVEL}, decompression {inflate:6.0f} MB/s")
+
+    # A GCS upload stream raises on flush(); the gzip layer must finish without ever calling it
+    class UnflushableStream(io.BytesIO):
+        def flush(self):
+            raise io.UnsupportedOperation("flush")
+
+    class UnflushableStore(object_store.MemoryStore):
+        @contextlib.contextmanager
+        def open_write(self, name, mode='w', content_type=None):
+            stream = UnflushableStream()
+            yield stream
+            self.objects[name] = stream.getvalue()
+
+    unflushable = UnflushableStore()
+    results = ((vehicle_id, synthetic_breadcrumbs(vehicle_id)) for vehicle_id in vehicle_ids)
+    try:
+        with object_store.open_text_write(unflushable, "data/TriMet__2024-05-01.json", compress=True) as stream:
+            write_snapshot(stream, vehicle_ids, results)
+        same = unflushable.objects["data/TriMet__2024-05-01.json.gz"] == store.objects["data/TriMet__2024-05-01.json.gz"]
+        print(f"Gzip upload to a stream that cannot flush: finished, same bytes: {same}")
+    except io.UnsupportedOperation:
+        print("Gzip upload to a stream that cannot flush: FAILED at close")
+
+
+def bench_counter(days="30", vehicles="40"):
+    """Counts a month of day files: json.load per file vs the streaming structural counter."""
+    import os
+    import tempfile
+    import breadcrumb_counter
+
+    def with_json_load(paths):
+        total = 0
+        for path in paths:
+            with open(path, "r") as file:
+                total += sum(len(events) for events in json.load(file).values())
+        return total
+
+    def with_counter(paths):
+        return sum(sum(breadcrumb_counter.count_file(path)[0].values()) for path in paths)
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_synthetic_corpus(folder, int(days), int(vehicles), 1000)
+        paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+        size = sum(os.path.getsize(path) for path in paths) / 1e6
+        print(f"{days} days, {size:.0f} MB")
+        for label, function in (("json.load", with_json_load), ("streaming counter", with_counter)):
+            start = time.perf_counter()
+            function(paths)
+            elapsed = time.perf_counter() - start
+            # Traced separately on one file, since tracing slows the scan down
+            peak = measure_peak(function, paths[:1])[1]
+            print(f"{label:>18}: {elapsed:6.2f}s ({size / elapsed:4.0f} MB/s), peak {peak:7.1f} MB per file")
+        breadcrumb_counter.FOLDER_PATH = folder
+        for workers in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            breadcrumb_counter.count_breadcrumbs_in_files([os.path.basename(path) for path in paths], workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{f'{workers} worker(s)':>18}: {elapsed:6.2f}s ({size / elapsed:4.0f} MB/s)")
+
+
+def local_postgres():
+    """DSN of a throwaway Postgres: BENCH_DATABASE_URL if set, otherwise a pgserver instance under /tmp."""
+    import os
+    if os.environ.get("BENCH_DATABASE_URL"):
+        return os.environ["BENCH_DATABASE_URL"]
+    import pgserver
+    return pgserver.get_server("/tmp/bench_pgdata", cleanup_mode="stop").get_uri()
+
+
+def bench_bulk_load(vehicles="1000", per_vehicle="100"):
+    """Breadcrumb rows/s into Postgres: per-file commits vs batched transactions over several connections."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import psycopg2
+    import database_uploader
+    import json_cleanup
+
+    database_uploader.DB_SETTINGS = {"dsn": local_postgres()}
+    conn = database_uploader.connect_db()
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS breadcrumb, trip, upload_ledger CASCADE")
+        cursor.execute("CREATE TABLE trip (trip_id integer PRIMARY KEY, route_id integer, vehicle_id integer, "
+                       "service_key text, direction text)")
+        cursor.execute("CREATE TABLE breadcrumb (tstamp timestamp, latitude float, longitude float, speed float, "
+                       "trip_id integer REFERENCES trip)")
+        cursor.execute(f"CREATE UNIQUE INDEX {database_uploader.BREADCRUMB_KEY_INDEX} ON breadcrumb (trip_id, tstamp)")
+    conn.commit()
+
+    with tempfile.TemporaryDirectory() as folder:
+        json_cleanup.INPUT_FOLDER = os.path.join(folder, "downloaded_jsons")
+        json_cleanup.OUTPUT_FOLDER = os.path.join(folder, "cleaned_jsons")
+        write_synthetic_corpus(json_cleanup.INPUT_FOLDER, 1, int(vehicles), int(per_vehicle))
+        with contextlib.redirect_stdout(io.StringIO()):
+            json_cleanup.clean_json_files()
+        database_uploader.HISTORY_FILE = os.path.join(folder, "upload_history.txt")
+        print(f"{len(os.listdir(json_cleanup.OUTPUT_FOLDER))} cleaned files")
+
+        def run(label, bulk, batch_files=1, workers=1):
+            with conn.cursor() as cursor:
+                cursor.execute("TRUNCATE breadcrumb, trip")
+                cursor.execute("DROP TABLE IF EXISTS upload_ledger")
+            conn.commit()
+            database_uploader.BULK_LOAD = bulk
+            start = time.perf_counter()
+            database_uploader.process_json_files(json_cleanup.OUTPUT_FOLDER, batch_files=batch_files, workers=workers)
+            elapsed = time.perf_counter() - start
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM breadcrumb")
+                rows = cursor.fetchone()[0]
+            conn.rollback()
+            print(f"{label:>28}: {rows} rows in {elapsed:6.2f}s ({rows / elapsed:9.0f} rows/s)")
+
+        run("per file (one commit each)", False)
+        for batch_files in (1, 10, 50):
+            for workers in sorted({1, database_uploader.LOAD_WORKERS}):
+                run(f"batch {batch_files}, {workers} worker(s)", True, batch_files, workers)
+    database_uploader.close_db(conn)
+
+
+def bench_stopevents_load(days="3", vehicles="50"):
+    """Seconds per stop events day file into Postgres: a commit per trip vs one transaction per file."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import database_stopevents_uploader as uploader
+    from stop_events_parser import parse_stop_events
+
+    uploader.DB_SETTINGS = {"dsn": local_postgres()}
+    conn = uploader.connect_db()
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS breadcrumb, trip, stopevents_details, stopevents_trips, trip_enrichment_pending, upload_ledger CASCADE")
+        cursor.execute("CREATE TABLE trip (trip_id integer PRIMARY KEY, route_id integer, vehicle_id integer, "
+                       "service_key text, direction boolean)")
+        cursor.execute("CREATE TABLE breadcrumb (tstamp timestamp, latitude float, longitude float, speed float, "
+                       "trip_id integer REFERENCES trip)")
+        cursor.execute("CREATE TABLE stopevents_trips (trip_id serial PRIMARY KEY, trip_name integer)")
+        cursor.execute("CREATE TABLE stopevents_details (vehicle_number text, leave_time integer, train text, "
+                       "route_number text, direction integer, service_key text, trip_number text, stop_time integer, "
+                       "arrive_time integer, dwell integer, location_id text, door integer, lift integer, ons integer, "
+                       "offs integer, estimated_load integer, maximum_speed float, train_mileage float, "
+                       "pattern_distance integer, location_distance integer, x_coordinate float, y_coordinate float, "
+                       "data_source text, schedule_status integer, trip_id integer REFERENCES stopevents_trips)")
+    conn.commit()
+    uploader.schema_ready = False
+
+    with tempfile.TemporaryDirectory() as folder:
+        day = {str(vehicle_id): parse_stop_events(synthetic_stop_events_page(vehicle_id)) for vehicle_id in range(int(vehicles))}
+        # A trip listed twice (here under a second vehicle) gets a stopevents_trips row per listing on both paths
+        day["1"].append(day["0"][0])
+        for index in range(int(days)):
+            with open(os.path.join(folder, f"TriMet_StopEvents_2024-04-{index + 1:02d}.json"), "w") as file:
+                json.dump(day, file)
+        uploader.HISTORY_FILE = os.path.join(folder, "upload_stopevents_history.txt")
+        trips = sum(len(trips) for trips in day.values())
+        print(f"{days} day files of {trips} trips")
+
+        def reset():
+            with conn.cursor() as cursor:
+                cursor.execute("TRUNCATE stopevents_details, stopevents_trips")
+                cursor.execute("DROP TABLE IF EXISTS upload_ledger")
+            conn.commit()
+
+        layouts = {}
+        for label, bulk in (("commit per trip", False), ("one transaction per file", True)):
+            reset()
+            uploader.BULK_LOAD = bulk
+            start = time.perf_counter()
+            with contextlib.redirect_stderr(io.StringIO()):
+                uploader.process_json_files(folder)
+            elapsed = time.perf_counter() - start
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM stopevents_details")
+                rows = cursor.fetchone()[0]
+                # Trip rows per name and detail rows per trip row, independent of the generated IDs
+                cursor.execute("SELECT st.trip_name, count(s.*) FROM stopevents_trips st "
+                               "LEFT JOIN stopevents_details s ON s.trip_id = st.trip_id GROUP BY st.trip_id ORDER BY 1, 2")
+                layouts[label] = cursor.fetchall()
+            conn.rollback()
+            print(f"{label:>25}: {rows} rows, {elapsed / int(days):6.2f}s per file ({rows / elapsed:7.0f} rows/s)")
+        print(f"Same trip rows on both paths: {len(set(map(str, layouts.values()))) == 1} "
+              f"({len(layouts['commit per trip'])} trip rows)")
+
+        reset()
+        path = uploader.load_history([os.path.join(folder, sorted(os.listdir(folder))[0])])[0]
+        _, peak = measure_peak(uploader.load_file, path)
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f"Peak traced memory loading one {size:.1f} MB file: {peak:.1f} MB")
+    uploader.close_db(conn)
+
+
+def bench_enrichment(histories="30,90", trips_per_day="300", vehicles="25"):
+    """Enrichment time after loading one new stop events day, for growing histories: full rebuild vs queued trips."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import database_stopevents_uploader as uploader
+    from stop_events_parser import parse_stop_events
+
+    uploader.DB_SETTINGS = {"dsn": local_postgres()}
+    uploader.INCREMENTAL_ENRICHMENT = True
+    day = {str(vehicle_id): parse_stop_events(synthetic_stop_events_page(vehicle_id)) for vehicle_id in range(int(vehicles))}
+    new_trips = [uploader.extract_integer_from_string(trip["trip"]) for trips in day.values() for trip in trips]
+    conn = uploader.connect_db()
+
+    for days in map(int, histories.split(",")):
+        history = days * int(trips_per_day)
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS breadcrumb, trip, stopevents_details, stopevents_trips, trip_enrichment_pending, upload_ledger CASCADE")
+            cursor.execute("CREATE TABLE trip (trip_id integer PRIMARY KEY, route_id integer, vehicle_id integer, "
+                           "service_key text, direction boolean)")
+            cursor.execute("CREATE TABLE breadcrumb (tstamp timestamp, latitude float, longitude float, speed float, "
+                           "trip_id integer REFERENCES trip)")
+            cursor.execute("CREATE TABLE stopevents_trips (trip_id serial PRIMARY KEY, trip_name integer)")
+            cursor.execute("CREATE TABLE stopevents_details (vehicle_number text, leave_time integer, train text, "
+                           "route_number text, direction integer, service_key text, trip_number text, stop_time integer, "
+                           "arrive_time integer, dwell integer, location_id text, door integer, lift integer, ons integer, "
+                           "offs integer, estimated_load integer, maximum_speed float, train_mileage float, "
+                           "pattern_distance integer, location_distance integer, x_coordinate float, y_coordinate float, "
+                           "data_source text, schedule_status integer, trip_id integer REFERENCES stopevents_trips)")
+            # History: trips with breadcrumbs and stop events, already enriched
+            cursor.execute("INSERT INTO trip SELECT g, g %% 90, g %% 500, 'Weekday', true FROM generate_series(1, %s) g", (history,))
+            cursor.execute("INSERT INTO breadcrumb SELECT now(), 45.5, -122.6, 5, g FROM generate_series(1, %s) g, generate_series(1, 10)", (history,))
+            cursor.execute("INSERT INTO stopevents_trips (trip_name) SELECT g FROM generate_series(1, %s) g", (history,))
+            cursor.execute("INSERT INTO stopevents_details (vehicle_number, route_number, direction, service_key, trip_id) "
+                           "SELECT (trip_id % 500)::text, (trip_id % 90)::text, 1, 'W', trip_id FROM stopevents_trips, generate_series(1, 10)")
+            # The new day's breadcrumbs, as database_uploader leaves them before enrichment
+            cursor.execute("INSERT INTO trip SELECT unnest(%s::integer[]), 1, 0, 'Weekday', true", (new_trips,))
+            cursor.execute("INSERT INTO breadcrumb SELECT now(), 45.5, -122.6, 5, t FROM unnest(%s::integer[]) t, generate_series(1, 10)", (new_trips,))
+            cursor.execute("ANALYZE")
+        conn.commit()
+        uploader.schema_ready = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            indexed = uploader.build_join_indexes()
+
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, "TriMet_StopEvents_2024-04-01.json"), "w") as file:
+                json.dump(day, file)
+            uploader.HISTORY_FILE = os.path.join(folder, "upload_stopevents_history.txt")
+            with contextlib.redirect_stderr(io.StringIO()):
+                uploader.process_json_files(folder)
+
+        start = time.perf_counter()
+        updated = uploader.enrich_pending_trips()
+        incremental = time.perf_counter() - start
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM trip WHERE trip_id = ANY(%s) AND route_id = 8", (new_trips,))
+            enriched = cursor.fetchone()[0]
+        conn.rollback()
+        start = time.perf_counter()
+        uploader.execute_sql_query()
+        full = time.perf_counter() - start
+        print(f"{days:4d} days ({history} trips): incremental {incremental:6.3f}s ({updated} trips, {enriched} enriched), "
+              f"full rebuild {full:6.2f}s, join indexes built: {indexed}")
+    uploader.close_db(conn)
+
+
+def bench_copy_encoder(rows="1000000"):
+    """COPY rows/s and peak memory: f-strings into a StringIO vs the streaming copy_encoder, for dict rows and columns."""
+    import io
+    import numpy as np
+    import psycopg2
+    from cleaned_format import epoch_to_iso
+    from copy_encoder import copy_lines, encode_columns, encode_rows
+
+    count = int(rows)
+    columns = ("tstamp", "latitude", "longitude", "speed", "trip_id")
+    tstamps = 1712800000 + np.arange(count, dtype=np.int64) * 5
+    arrays = {"tstamp": tstamps, "latitude": np.random.uniform(45.3, 45.6, count).astype(np.float32),
+              "longitude": np.random.uniform(-122.9, -122.4, count).astype(np.float32),
+              "speed": np.random.uniform(0, 20, count).astype(np.float32), "trip_id": np.full(count, 230001234)}
+    breadcrumbs = [{"tstamp": tstamp, "latitude": float(latitude), "longitude": float(longitude), "speed": float(speed)}
+                   for tstamp, latitude, longitude, speed in
+                   zip(epoch_to_iso(tstamps), arrays["latitude"], arrays["longitude"], arrays["speed"])]
+
+    conn = psycopg2.connect(local_postgres())
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS copy_bench")
+        cursor.execute("CREATE UNLOGGED TABLE copy_bench (tstamp timestamp, latitude float, longitude float, speed float, trip_id integer)")
+    conn.commit()
+
+    def stringio_rows():
+        buffer = io.StringIO()
+        for b in breadcrumbs:
+            buffer.write(f"{b['tstamp']},{b['latitude']},{b['longitude']},{b['speed']},230001234\n")
+        buffer.seek(0)
+        with conn.cursor() as cursor:
+            cursor.copy_from(buffer, "copy_bench", sep=",", columns=columns)
+
+    def encoder_rows():
+        with conn.cursor() as cursor:
+            copy_lines(cursor, "copy_bench", columns, encode_rows(
+                (b["tstamp"], b["latitude"], b["longitude"], b["speed"], 230001234) for b in breadcrumbs))
+
+    def stringio_columns():
+        buffer = io.StringIO()
+        for fields in zip(epoch_to_iso(arrays["tstamp"]), arrays["latitude"].astype(str), arrays["longitude"].astype(str),
+                          arrays["speed"].astype(str)):
+            buffer.write(f"{fields[0]},{fields[1]},{fields[2]},{fields[3]},230001234\n")
+        buffer.seek(0)
+        with conn.cursor() as cursor:
+            cursor.copy_from(buffer, "copy_bench", sep=",", columns=columns)
+
+    def encoder_columns():
+        with conn.cursor() as cursor:
+            copy_lines(cursor, "copy_bench", columns, encode_columns(
+                [epoch_to_iso(arrays["tstamp"]), arrays["latitude"], arrays["longitude"], arrays["speed"], arrays["trip_id"]]))
+
+    print(f"{count} breadcrumbs")
+    for label, function in (("StringIO, dict rows", stringio_rows), ("encoder, dict rows", encoder_rows),
+                            ("StringIO, columns", stringio_columns), ("encoder, columns", encoder_columns)):
+        start = time.perf_counter()
+        function()
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE copy_bench")
+        conn.commit()
+        # Traced in a second run that is rolled back, since tracing slows the load down
+        peak = measure_peak(function)[1]
+        conn.rollback()
+        print(f"{label:>20}: {count / elapsed:9.0f} rows/s, peak {peak:7.1f} MB")
+
+    # Values that the comma-separated f-string output could not carry
+    awkward = [("a,b", "tab\there", "line\nbreak", "back\\slash", None), ("", "\\N", "cr\rlf", "'quoted'", "plain")]
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TEMP TABLE copy_roundtrip (a text, b text, c text, d text, e text)")
+        copy_lines(cursor, "copy_roundtrip", ("a", "b", "c", "d", "e"), encode_rows(awkward))
+        cursor.execute("SELECT a, b, c, d, e FROM copy_roundtrip")
+        print(f"Round trip of awkward values: {'ok' if cursor.fetchall() == awkward else 'MISMATCH'}")
+    conn.rollback()
+    conn.close()
+
+
+def bench_ledger(files="200", ledger_rows="100000"):
+    """Fault injection for the upload ledger: crashes and failed COPYs must never load a file twice or lose one."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import threading
+    import psycopg2
+    import database_uploader
+    import json_cleanup
+    from upload_ledger import pending_files
+
+    database_uploader.DB_SETTINGS = {"dsn": local_postgres()}
+    conn = database_uploader.connect_db()
+    real_load_batch = database_uploader.load_batch
+    real_copy_lines = database_uploader.copy_lines
+    calls = {"n": 0}
+
+    def reset():
+        calls["n"] = 0
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS breadcrumb, trip, upload_ledger CASCADE")
+            cursor.execute("CREATE TABLE trip (trip_id integer PRIMARY KEY, route_id integer, vehicle_id integer, "
+                           "service_key text, direction boolean)")
+            cursor.execute("CREATE TABLE breadcrumb (tstamp timestamp, latitude float, longitude float, speed float, "
+                           "trip_id integer REFERENCES trip)")
+            cursor.execute(f"CREATE UNIQUE INDEX {database_uploader.BREADCRUMB_KEY_INDEX} ON breadcrumb (trip_id, tstamp)")
+        conn.commit()
+
+    def counts():
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT (SELECT count(*) FROM breadcrumb), (SELECT count(*) FROM upload_ledger)")
+            result = cursor.fetchone()
+        conn.rollback()
+        return result
+
+    def load(folder):
+        try:
+            database_uploader.process_json_files(folder, batch_files=10, workers=2)
+        except (SystemExit, KeyboardInterrupt):
+            return "crashed"
+        return "finished"
+
+    def crash_after_commit(filepaths):
+        result = real_load_batch(filepaths)
+        calls["n"] += 1
+        if calls["n"] == 3:
+            raise SystemExit("killed after a commit")
+        return result
+
+    def crash_mid_copy(cursor, table, columns, lines):
+        calls["n"] += 1
+        if calls["n"] == 3:
+            lines = iter(lines)
+            real_copy_lines(cursor, table, columns, [next(lines)])
+            raise KeyboardInterrupt("killed halfway through a COPY")
+        return real_copy_lines(cursor, table, columns, lines)
+
+    def failing_copy(cursor, table, columns, lines):
+        calls["n"] += 1
+        if calls["n"] % 4 == 0:
+            raise psycopg2.OperationalError("connection lost during COPY")
+        return real_copy_lines(cursor, table, columns, lines)
+
+    report = []
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        json_cleanup.INPUT_FOLDER = os.path.join(folder, "downloaded_jsons")
+        json_cleanup.OUTPUT_FOLDER = cleaned = os.path.join(folder, "cleaned_jsons")
+        write_synthetic_corpus(json_cleanup.INPUT_FOLDER, 1, int(files), 50)
+        json_cleanup.clean_json_files()
+        database_uploader.HISTORY_FILE = os.path.join(folder, "upload_history.txt")
+        reset()
+        load(cleaned)
+        expected = counts()
+        report.append(f"Clean load: {expected[0]} rows from {expected[1]} files")
+
+        for label, target, fault in (("crash after a commit", "load_batch", crash_after_commit),
+                                     ("crash halfway through a COPY", "copy_lines", crash_mid_copy),
+                                     ("every 4th COPY fails", "copy_lines", failing_copy)):
+            reset()
+            setattr(database_uploader, target, fault)
+            outcome = load(cleaned)
+            partial = counts()
+            database_uploader.load_batch = real_load_batch
+            database_uploader.copy_lines = real_copy_lines
+            reruns = 0
+            while counts() != expected and reruns < 5:
+                load(cleaned)
+                reruns += 1
+            result = "exactly once" if counts() == expected else f"WRONG {counts()}"
+            report.append(f"{label:>30}: first run {outcome} with {partial[0]} rows, {result} after {reruns} rerun(s)")
+
+        reset()
+        threads = [threading.Thread(target=load, args=(cleaned,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report.append(f"{'three runs at once':>30}: {'exactly once' if counts() == expected else f'WRONG {counts()}'}")
+
+        # An old text history is moved into the ledger, and the files in it are not loaded again
+        reset()
+        names = sorted(name for name in os.listdir(cleaned) if name.endswith(".json"))
+        with open(database_uploader.HISTORY_FILE, "w") as history_file:
+            history_file.writelines(f"cleaned_jsons/{name}\n" for name in names[:len(names) // 2])
+        load(cleaned)
+        migrated = os.path.exists(database_uploader.HISTORY_FILE + ".migrated")
+        report.append(f"{'migrated text history':>30}: {counts()[0]} rows loaded for the other half, file renamed: {migrated}")
+
+        # Startup: which files still need loading, against a ledger with many other entries
+        load(cleaned)
+        with conn.cursor() as cursor:
+            cursor.execute("INSERT INTO upload_ledger (loader, file_name, size, mtime_ns, sha256) "
+                           "SELECT 'breadcrumbs', 'history_' || g || '.json', 1, 1, 'x' FROM generate_series(1, %s) g",
+                           (int(ledger_rows),))
+        conn.commit()
+        paths = [os.path.join(cleaned, name) for name in names]
+        with conn.cursor() as cursor:
+            start = time.perf_counter()
+            pending = pending_files(cursor, database_uploader.LEDGER_LOADER, paths)
+            elapsed = time.perf_counter() - start
+        conn.rollback()
+        report.append(f"Startup check of {len(paths)} files against {int(ledger_rows) + len(paths)} ledger rows: "
+                      f"{elapsed * 1000:.1f} ms, {len(pending)} pending")
+    database_uploader.close_db(conn)
+    print("\n".join(report))
+
+
+def bench_merge(vehicles="200", per_vehicle="2000"):
+    """Plain COPY vs staging-table merge on (trip_id, tstamp): first loads, reloads, and the rows each leaves behind."""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import database_uploader
+    import json_cleanup
+
+    database_uploader.DB_SETTINGS = {"dsn": local_postgres()}
+    conn = database_uploader.connect_db()
+
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stderr(io.StringIO()):
+        json_cleanup.INPUT_FOLDER = os.path.join(folder, "downloaded_jsons")
+        json_cleanup.OUTPUT_FOLDER = cleaned = os.path.join(folder, "cleaned_jsons")
+        write_synthetic_corpus(json_cleanup.INPUT_FOLDER, 1, int(vehicles), int(per_vehicle))
+        with contextlib.redirect_stdout(io.StringIO()):
+            json_cleanup.clean_json_files()
+        database_uploader.HISTORY_FILE = os.path.join(folder, "upload_history.txt")
+
+        def run(label, merge, reload=False, keyed=False):
+            with conn.cursor() as cursor:
+                if not reload:
+                    cursor.execute("DROP TABLE IF EXISTS breadcrumb, trip CASCADE")
+                    cursor.execute("CREATE TABLE trip (trip_id integer PRIMARY KEY, route_id integer, vehicle_id integer, "
+                                   "service_key text, direction boolean)")
+                    cursor.execute("CREATE TABLE breadcrumb (tstamp timestamp, latitude float, longitude float, "
+                                   "speed float, trip_id integer REFERENCES trip)")
+                    if keyed:
+                        cursor.execute(f"CREATE UNIQUE INDEX {database_uploader.BREADCRUMB_KEY_INDEX} ON breadcrumb (trip_id, tstamp)")
+                # Forget the ledger so a reload really sends every file again
+                cursor.execute("DROP TABLE IF EXISTS upload_ledger")
+            conn.commit()
+            database_uploader.MERGE_LOAD = merge
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                database_uploader.process_json_files(cleaned)
+            elapsed = time.perf_counter() - start
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT count(*), count(DISTINCT (trip_id, tstamp)) FROM breadcrumb")
+                rows, distinct = cursor.fetchone()
+            conn.rollback()
+            print(f"{label:>24}: {elapsed:6.2f}s, {rows} rows in breadcrumb ({rows - distinct} duplicates)")
+
+        run("plain COPY", False)
+        run("plain COPY, reload", False, reload=True)
+        database_uploader.MERGE_LOAD = True
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS upload_ledger")
+        conn.commit()
+        try:
+            database_uploader.process_json_files(cleaned)
+            print("Merge load without the unique index: ran anyway")
+        except RuntimeError:
+            print("Merge load without the unique index: refused")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            database_uploader.build_breadcrumb_key()
+        elapsed = time.perf_counter() - start
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*), count(DISTINCT (trip_id, tstamp)) FROM breadcrumb")
+            rows, distinct = cursor.fetchone()
+            valid = database_uploader.breadcrumb_key_valid(cursor)
+        conn.rollback()
+        print(f"{'--build-breadcrumb-key':>24}: {elapsed:6.2f}s, {rows} rows in breadcrumb "
+              f"({rows - distinct} duplicates), index valid: {valid}")
+        # The unique index alone, without the staging table, to split the merge's cost
+        run("plain COPY, unique index", False, keyed=True)
+        run("merge", True, keyed=True)
+        run("merge, reload", True, reload=True)
+    database_uploader.close_db(conn)
+
+
+BENCHMARKS = {
+    "fetch": bench_fetch,
+    "snapshot": bench_snapshot,
+    "roster": bench_roster,
+    "checkpoint": bench_checkpoint,
+    "stop_events_parser": bench_stop_events_parser,
+    "receiver": bench_receiver,
+    "publish": bench_publish,
+    "transformations": bench_transformations,
+    "validation": bench_validation,
+    "imputation": bench_imputation,
+    "cleaning": bench_cleaning,
+    "stream_reader": bench_stream_reader,
+    "cleaned_format": bench_cleaned_format,
+    "timestamps": bench_timestamps,
+    "manifest": bench_manifest,
+    "bucket_download": bench_bucket_download,
+    "object_store": bench_object_store,
+    "compression": bench_compression,
+    "counter": bench_counter,
+    "bulk_load": bench_bulk_load,
+    "stopevents_load": bench_stopevents_load,
+    "enrichment": bench_enrichment,
+    "copy_encoder": bench_copy_encoder,
+    "ledger": bench_ledger,
+    "merge": bench_merge,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python3 benchmarks.py [{'|'.join(BENCHMARKS)}] [args...]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,28 @@
+import json
+import zlib
+
+# Message attribute naming how the payload is encoded. Messages without it hold one JSON breadcrumb.
+ENCODING_ATTRIBUTE = "encoding"
+JSON_LINES = "jsonl"
+JSON_LINES_ZLIB = "jsonl+zlib"
+COMPRESSION_LEVEL = 6
+
+
+def encode_breadcrumbs(breadcrumbs, compress=True):
+    """Packs a list of breadcrumbs into one message body. Returns (data, attributes)."""
+    data = "\n".join(json.dumps(breadcrumb) for breadcrumb in breadcrumbs).encode("utf-8")
+    if compress:
+        return zlib.compress(data, COMPRESSION_LEVEL), {ENCODING_ATTRIBUTE: JSON_LINES_ZLIB, "count": str(len(breadcrumbs))}
+    return data, {ENCODING_ATTRIBUTE: JSON_LINES, "count": str(len(breadcrumbs))}
+
+
+def decode_message(data, attributes=None):
+    """Returns the list of breadcrumbs carried by a message, whichever way it was encoded."""
+    encoding = (attributes or {}).get(ENCODING_ATTRIBUTE)
+    if encoding is None:
+        return [json.loads(data.decode("utf-8"))]
+    if encoding == JSON_LINES_ZLIB:
+        data = zlib.decompress(data)
+    elif encoding != JSON_LINES:
+        raise ValueError(f"Unknown breadcrumb message encoding: {encoding}")
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
@@ -1,56 +1,93 @@
-import json
+import argparse
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
-from pathlib import Path
+from json_stream import iter_vehicle_counts
 
 # Directory where JSON files are stored
 FOLDER_PATH = 'downloaded_jsons'
+DAY_FILE = re.compile(r'TriMet__(\d{4}-\d{2}-\d{2})\.json(\.gz)?$')
 
-def count_breadcrumbs_in_files(file_names):
-    """Count breadcrumbs in specified JSON files from the local directory."""
-    breadcrumb_counts = {}
-    total_breadcrumbs = 0
-
-    pbar = tqdm(file_names, desc="Counting breadcrumbs in files")
-    
-    for file_name in pbar:
-        file_path = Path(FOLDER_PATH) / file_name
-        if file_path.exists():
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-            breadcrumb_count = sum(len(events) for events in data.values())
-            breadcrumb_counts[file_name] = breadcrumb_count
-            total_breadcrumbs += breadcrumb_count
-            pbar.set_description(f"Counted {breadcrumb_count} breadcrumbs in {file_name}")
-        else:
-            pbar.set_description(f"{file_name} does not exist")
-            breadcrumb_counts[file_name] = None
+def count_file(file_path):
+    """Counts one day file in a single streaming pass. Returns (per-vehicle counts, text bytes, seconds)."""
+    start = time.perf_counter()
+    vehicle_counts = {}
+    text_bytes = 0
+    for vehicle_id, count, length in iter_vehicle_counts(file_path):
+        vehicle_counts[vehicle_id] = count
+        text_bytes += length
+    return vehicle_counts, text_bytes, time.perf_counter() - start
 
-    return breadcrumb_counts, total_breadcrumbs
+def find_day_files(folder=FOLDER_PATH, start_date=None, end_date=None):
+    """Returns {date: file name} for the day files in folder, optionally limited to a date range (YYYY-MM-DD)."""
+    day_files = {}
+    for file_name in sorted(os.listdir(folder)):
+        match = DAY_FILE.match(file_name)
+        if not match:
+            continue
+        date = match.group(1)
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        # A day downloaded both ways is counted once; the uncompressed name sorts first
+        day_files.setdefault(date, file_name)
+    return day_files
+
+def count_breadcrumbs_in_files(file_names, workers=1):
+    """Count breadcrumbs in specified JSON files from the local directory.
+
+    Returns ({file name: stats or None if missing}, total breadcrumbs), where
+    stats holds the per-vehicle counts, file and text sizes and scan time.
+    """
+    breadcrumb_counts = {file_name: None for file_name in file_names}
+    paths = {file_name: os.path.join(FOLDER_PATH, file_name) for file_name in file_names
+             if os.path.exists(os.path.join(FOLDER_PATH, file_name))}
 
-def generate_date_named_files(start_date, end_date, prefix="TriMet__", suffix=".json"):
-    from datetime import datetime, timedelta
-    date_list = []
-    current_date = start_date
-    while current_date <= end_date:
-        formatted_date = current_date.strftime('%Y-%m-%d')
-        file_name = f"{prefix}{formatted_date}{suffix}"
-        date_list.append(file_name)
-        current_date += timedelta(days=1)
-    return date_list
+    pbar = tqdm(total=len(paths), desc="Counting breadcrumbs in files")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_name, (vehicle_counts, text_bytes, seconds) in zip(paths, executor.map(count_file, paths.values())):
+            breadcrumb_counts[file_name] = {
+                'vehicles': vehicle_counts,
+                'breadcrumbs': sum(vehicle_counts.values()),
+                'file_bytes': os.path.getsize(paths[file_name]),
+                'text_bytes': text_bytes,
+                'seconds': seconds,
+            }
+            pbar.update(1)
+            pbar.set_description(f"Counted {breadcrumb_counts[file_name]['breadcrumbs']} breadcrumbs in {file_name}")
+    pbar.close()
+
+    total_breadcrumbs = sum(stats['breadcrumbs'] for stats in breadcrumb_counts.values() if stats)
+    return breadcrumb_counts, total_breadcrumbs
 
 if __name__ == "__main__":
-    from datetime import datetime
-    start_date = datetime(2024, 4, 11)
-    end_date = datetime.now()
-    file_names = generate_date_named_files(start_date, end_date)
+    parser = argparse.ArgumentParser(description="Count breadcrumbs per day and per vehicle in the downloaded day files.")
+    parser.add_argument('--start', help="First date to count (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last date to count (YYYY-MM-DD)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument('--per-vehicle', action='store_true', help="Also print breadcrumb totals per vehicle")
+    args = parser.parse_args()
 
-    breadcrumb_counts, total_breadcrumbs = count_breadcrumbs_in_files(file_names)
+    start = time.perf_counter()
+    day_files = find_day_files(start_date=args.start, end_date=args.end)
+    breadcrumb_counts, total_breadcrumbs = count_breadcrumbs_in_files(list(day_files.values()), workers=args.workers)
+    elapsed = time.perf_counter() - start
 
-    for file_name, count in breadcrumb_counts.items():
-        if count is not None:
-            print(f"{file_name}: {count} breadcrumbs")
-        else:
-            print(f"{file_name}: File does not exist")
+    vehicle_totals = Counter()
+    for date, file_name in day_files.items():
+        stats = breadcrumb_counts[file_name]
+        vehicle_totals.update(stats['vehicles'])
+        print(f"{date}: {stats['breadcrumbs']} breadcrumbs from {len(stats['vehicles'])} vehicles, "
+              f"{stats['file_bytes'] / 1e6:.1f} MB on disk ({stats['text_bytes'] / 1e6:.1f} MB JSON), "
+              f"{stats['text_bytes'] / 1e6 / max(stats['seconds'], 1e-9):.0f} MB/s")
 
-    print(f"\nTotal breadcrumbs counted: {total_breadcrumbs}")
+    if args.per_vehicle:
+        print()
+        for vehicle_id, count in sorted(vehicle_totals.items(), key=lambda item: int(item[0])):
+            print(f"Vehicle {vehicle_id}: {count} breadcrumbs")
 
+    text_bytes = sum(stats['text_bytes'] for stats in breadcrumb_counts.values())
+    print(f"\nTotal breadcrumbs counted: {total_breadcrumbs} in {len(day_files)} days, {len(vehicle_totals)} vehicles")
+    print(f"Scanned {text_bytes / 1e6:.1f} MB of JSON in {elapsed:.2f}s ({text_bytes / 1e6 / max(elapsed, 1e-9):.0f} MB/s)")
@@ -0,0 +1,140 @@
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+# Constants
+SPILL_FOLDER = 'receiver_spill'
+SPILL_MAX_MESSAGES = 20000  # Spill once this many messages are buffered...
+SPILL_MAX_SECONDS = 60      # ...or once the oldest buffered message is this old
+
+
+class SpillBuffer:
+    """Bounded buffer for received breadcrumbs that spills sorted runs to local disk.
+
+    Messages are only acknowledged once the run holding them has been fsynced,
+    so a crash loses nothing that Pub/Sub will not redeliver. Runs are kept in
+    a folder per collection day (the date they were received), so runs an
+    earlier crash left behind are only ever merged into their own day's file.
+    """
+
+    def __init__(self, folder=SPILL_FOLDER, max_messages=SPILL_MAX_MESSAGES, max_seconds=SPILL_MAX_SECONDS):
+        self.folder = folder
+        self.max_messages = max_messages
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        self.records = []
+        self.unacked = []
+        self.oldest = None
+        self.day = None
+        os.makedirs(self.folder, exist_ok=True)
+        # The age threshold is also checked on a timer, so an idle subscriber still spills and acks
+        self.stopped = threading.Event()
+        self.timer = threading.Thread(target=self._watch, daemon=True)
+        self.timer.start()
+
+    def add(self, message, records):
+        """Buffers the breadcrumbs decoded from one message, spilling if a threshold is reached."""
+        day = collection_day()
+        with self.lock:
+            if day != self.day and self.unacked:
+                self._spill()  # Never mix two days in one run
+            self.day = day
+            for record in records:
+                self.records.append((record['VEHICLE_ID'], record['ACT_TIME'], json.dumps(record)))
+            self.unacked.append(message)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if len(self.records) >= self.max_messages or time.monotonic() - self.oldest >= self.max_seconds:
+                self._spill()
+
+    def flush(self):
+        """Spills whatever is still buffered."""
+        with self.lock:
+            self._spill()
+
+    def close(self):
+        """Spills whatever is still buffered and stops the timer."""
+        self.stopped.set()
+        self.timer.join()
+        self.flush()
+
+    def _watch(self):
+        while not self.stopped.wait(min(1, self.max_seconds)):
+            with self.lock:
+                if self.oldest is not None and time.monotonic() - self.oldest >= self.max_seconds:
+                    self._spill()
+
+    def _spill(self):
+        if self.unacked:
+            if self.records:
+                self.records.sort(key=lambda record: (record[0], record[1]))
+                folder = os.path.join(self.folder, self.day)
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f"run-{len(self.run_paths(self.day)):06}.jsonl")
+                with open(f"{path}.tmp", "w") as file:
+                    for vehicle_id, act_time, text in self.records:
+                        file.write(f"{json.dumps([vehicle_id, act_time])}\t{text}\n")
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(f"{path}.tmp", path)
+            for message in self.unacked:
+                message.ack()
+        self.records = []
+        self.unacked = []
+        self.oldest = None
+
+    def days(self):
+        """Returns the collection days that have spilled runs, oldest first."""
+        return sorted(day for day in os.listdir(self.folder) if self.run_paths(day))
+
+    def run_paths(self, day):
+        folder = os.path.join(self.folder, day)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".jsonl"))
+
+    def merge(self, stream, day):
+        """K-way merges one day's runs into one JSON object keyed by sorted VEHICLE_ID.
+
+        Returns the number of vehicles written.
+        """
+        files = [open(path, "r") for path in self.run_paths(day)]
+        try:
+            runs = [(_parse_line(line) for line in file) for file in files]
+            vehicles = 0
+            current = None
+            stream.write("{")
+            for vehicle_id, text in heapq.merge(*runs, key=lambda entry: entry[0]):
+                vehicle_id = vehicle_id[0]
+                if vehicle_id != current:
+                    if current is not None:
+                        stream.write("], ")
+                    stream.write(f"{json.dumps(str(vehicle_id))}: [")
+                    current = vehicle_id
+                    vehicles += 1
+                else:
+                    stream.write(", ")
+                stream.write(text)
+            stream.write("]}" if current is not None else "}")
+            return vehicles
+        finally:
+            for file in files:
+                file.close()
+
+    def clear(self, day):
+        """Removes one day's merged runs."""
+        shutil.rmtree(os.path.join(self.folder, day), ignore_errors=True)
+
+
+def collection_day():
+    """The date received breadcrumbs are filed under, as used in the day file name."""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _parse_line(line):
+    key, text = line.rstrip("\n").split("\t", 1)
+    return tuple(json.loads(key)), text
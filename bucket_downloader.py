@@ -1,14 +1,12 @@
 from datetime import datetime, timedelta
-import json
-from google.cloud import storage
 import os
-from tqdm import tqdm
 import psutil
+from bucket_sync import sync_prefix
+from object_store import GZIP_SUFFIX, get_store
 
 # Constants
-BUCKET_NAME = 'cs510-spring24-project1-bucket'
 FOLDER_NAME = 'data_via_direct_download'
-BUCKET_CREDENTIALS_FILE = 'cs510-project1-6c1b06b5846a.json'
+DOWNLOAD_WORKERS = 8
 LOCAL_DOWNLOAD_FOLDER = 'downloaded_jsons'
 
 TESTING = False
@@ -32,30 +30,16 @@ def generate_date_named_files(start_date, end_date, prefix="TriMet__", suffix=".
 
 
 def download_json_files_from_bucket(file_names):
-    client = storage.Client.from_service_account_json(BUCKET_CREDENTIALS_FILE)
-    bucket = client.bucket(BUCKET_NAME)
-    pbar = tqdm(file_names, desc="Downloading JSON files")
-
-    if not os.path.exists(LOCAL_DOWNLOAD_FOLDER):
-        os.makedirs(LOCAL_DOWNLOAD_FOLDER)
-
-    for file_name in pbar:
-        local_file_path = os.path.join(LOCAL_DOWNLOAD_FOLDER, file_name)
-
-        # Check if the file already exists locally
-        if not os.path.exists(local_file_path):
-            try:
-                blob = bucket.blob(f"{FOLDER_NAME}/{file_name}")
-                if blob.exists():
-                    blob.download_to_filename(local_file_path)
-                    pbar.set_description(f"Downloaded {file_name}")
-                else:
-                    pbar.set_description(f"{file_name} does not exist in bucket")
-            except Exception as e:
-                print(f"Failed to download {file_name}: {e}")
-                continue
-        else:
-            pbar.set_description(f"{file_name} already exists locally")
+    """Downloads the named files that are missing or changed locally.
+
+    The bucket folder is listed once and compared with the local copies by size
+    and checksum, then the differences are downloaded in parallel.
+    """
+    # Newer days are stored gzipped as <name>.gz and are kept compressed locally; the cleaners read both
+    file_names = list(file_names) + [f"{file_name}{GZIP_SUFFIX}" for file_name in file_names]
+    downloaded, unchanged, failed = sync_prefix(get_store(), FOLDER_NAME, LOCAL_DOWNLOAD_FOLDER,
+                                                file_names=file_names, workers=DOWNLOAD_WORKERS)
+    print(f"Downloaded {downloaded} files, {unchanged} already up to date, {failed} failed.")
 
 
 if __name__ == "__main__":
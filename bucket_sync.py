@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+# Constants
+DOWNLOAD_WORKERS = 8
+HASH_CHUNK_SIZE = 1 << 20
+CHECKSUM_CACHE_FILE = '.bucket_checksums'  # Local checksums keyed by (size, mtime), so unchanged files are not re-hashed
+
+
+def remote_checksum(info):
+    """(algorithm, base64 digest) the store reports for an object. Composite GCS objects only have CRC32C."""
+    if info.md5:
+        return 'md5', info.md5
+    return 'crc32c', info.crc32c
+
+
+def local_checksum(path, algorithm):
+    """Base64 digest of a local file in the same encoding as the bucket metadata."""
+    if algorithm == 'md5':
+        digest = hashlib.md5()
+    else:
+        import google_crc32c
+        digest = google_crc32c.Checksum()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode('ascii')
+
+
+class ChecksumCache:
+    """Remembers local file checksums until the file's size or mtime changes."""
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, CHECKSUM_CACHE_FILE)
+        try:
+            with open(self.path, 'r') as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def checksum(self, path, algorithm):
+        stat = os.stat(path)
+        entry = self.entries.get(f"{os.path.basename(path)}:{algorithm}")
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+        value = local_checksum(path, algorithm)
+        self.remember(path, algorithm, value)
+        return value
+
+    def remember(self, path, algorithm, value):
+        stat = os.stat(path)
+        self.entries[f"{os.path.basename(path)}:{algorithm}"] = [stat.st_size, stat.st_mtime_ns, value]
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.entries, file)
+        os.replace(temp_path, self.path)
+
+
+def is_current(info, local_path, cache):
+    """True if the local copy has the object's size and checksum."""
+    if not os.path.exists(local_path) or os.path.getsize(local_path) != info.size:
+        return False
+    algorithm, expected = remote_checksum(info)
+    return cache.checksum(local_path, algorithm) == expected
+
+
+def download_object(store, info, local_path):
+    """Downloads one object to a temp file, verifies it and renames it into place. Returns (algorithm, digest)."""
+    temp_path = f"{local_path}.download"
+    try:
+        store.download(info, temp_path)
+        algorithm, expected = remote_checksum(info)
+        # Ranged GCS downloads are not verified by the client, so every file is checked here
+        if local_checksum(temp_path, algorithm) != expected:
+            raise ValueError(f"{algorithm} mismatch for {info.name}")
+        os.replace(temp_path, local_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return algorithm, expected
+
+
+def sync_prefix(store, prefix, local_folder, file_names=None, workers=DOWNLOAD_WORKERS):
+    """Downloads the objects under prefix that are missing or different locally.
+
+    The prefix is listed once. If file_names is given, only those names are
+    considered. Returns (downloaded, unchanged, failed) counts.
+    """
+    os.makedirs(local_folder, exist_ok=True)
+    wanted = set(file_names) if file_names is not None else None
+    cache = ChecksumCache(local_folder)
+
+    to_download = []
+    unchanged = 0
+    for info in store.list(f"{prefix}/"):
+        name = info.name[len(prefix) + 1:]
+        if not name or '/' in name or (wanted is not None and name not in wanted):
+            continue
+        if is_current(info, os.path.join(local_folder, name), cache):
+            unchanged += 1
+        else:
+            to_download.append((info, os.path.join(local_folder, name)))
+
+    downloaded = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_object, store, info, path): (info, path) for info, path in to_download}
+        pbar = tqdm(as_completed(futures), total=len(futures), desc="Downloading JSON files")
+        for future in pbar:
+            info, path = futures[future]
+            try:
+                cache.remember(path, *future.result())
+                downloaded += 1
+                pbar.set_description(f"Downloaded {os.path.basename(info.name)}")
+            except Exception as e:
+                print(f"Failed to download {info.name}: {e}")
+                failed += 1
+
+    cache.save()
+    return downloaded, unchanged, failed
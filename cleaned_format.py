@@ -0,0 +1,43 @@
+import os
+import numpy as np
+
+# Typed columns of a cleaned vehicle-day; tstamp is seconds since the epoch (naive local time, like the JSON)
+BREADCRUMB_COLUMNS = {
+    'tstamp': np.int64,
+    'latitude': np.float32,
+    'longitude': np.float32,
+    'speed': np.float32,
+    'trip_id': np.int64,
+}
+TRIP_FIELDS = ('trip_id', 'route_id', 'vehicle_id', 'service_key', 'direction')
+
+
+def breadcrumbs_to_columns(breadcrumbs):
+    """Converts cleaned breadcrumb dicts into typed NumPy columns."""
+    columns = {name: np.array([b[name] for b in breadcrumbs], dtype=dtype)
+               for name, dtype in BREADCRUMB_COLUMNS.items() if name != 'tstamp'}
+    columns['tstamp'] = np.array([b['tstamp'] for b in breadcrumbs], dtype='datetime64[s]').astype(np.int64)
+    return columns
+
+
+def write_npz(path, trip_info, columns):
+    """Writes a vehicle-day as an uncompressed .npz, atomically via a temp file."""
+    arrays = {f"trip_{field}": np.array(trip_info[field]) for field in TRIP_FIELDS}
+    arrays.update({name: np.asarray(values, dtype=BREADCRUMB_COLUMNS[name]) for name, values in columns.items()})
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as out_file:
+        np.savez(out_file, **arrays)
+    os.replace(temp_path, path)
+
+
+def read_npz(path):
+    """Reads a vehicle-day written by write_npz. Returns (trip_info, columns)."""
+    with np.load(path) as archive:
+        trip_info = {field: archive[f"trip_{field}"].item() for field in TRIP_FIELDS}
+        columns = {name: archive[name] for name in BREADCRUMB_COLUMNS}
+    return trip_info, columns
+
+
+def epoch_to_iso(tstamps):
+    """Formats epoch-second timestamps the way the JSON output does (YYYY-MM-DDTHH:MM:SS)."""
+    return np.asarray(tstamps, dtype=np.int64).astype('datetime64[s]').astype(str)
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+# Constants
+CHECKPOINT_FOLDER = 'collection_checkpoints'
+DATE_FORMAT = "%Y-%m-%d"
+RESUME_HOURS = 6  # A checkpoint from an earlier day is resumed only if written to within this many hours
+ARCHIVE_FOLDER = 'stale'  # Under CHECKPOINT_FOLDER; where older checkpoints are moved instead of being resumed
+
+
+def run_filename(prefix, folder=CHECKPOINT_FOLDER):
+    """Returns the day file name for this collector run: {prefix}{date}.json.
+
+    The date is the one the run started on. A checkpoint an earlier run of the
+    same collector left behind is resumed, keeping its date, if it is from
+    today or was last written within RESUME_HOURS, so a restart after midnight
+    picks up the journal instead of orphaning it. Older checkpoints are moved to
+    ARCHIVE_FOLDER and the run starts fresh under today's date.
+    """
+    today = datetime.now().strftime(DATE_FORMAT)
+    dates = []
+    if os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            if not name.startswith(prefix):
+                continue
+            try:
+                date = datetime.strptime(name[len(prefix):], DATE_FORMAT).strftime(DATE_FORMAT)
+            except ValueError:
+                continue
+            path = os.path.join(folder, name)
+            journal_path = os.path.join(path, "journal.jsonl")
+            last_written = os.path.getmtime(journal_path if os.path.exists(journal_path) else path)
+            if date == today or time.time() - last_written < RESUME_HOURS * 3600:
+                dates.append(date)
+            else:
+                archive = os.path.join(folder, ARCHIVE_FOLDER)
+                os.makedirs(archive, exist_ok=True)
+                shutil.move(path, os.path.join(archive, name))
+                print(f"Archived stale checkpoint {name} to {archive}")
+    return f"{prefix}{min(dates) if dates else today}.json"
+
+
+class CollectionCheckpoint:
+    """Local journal of the vehicles a daily collection run has already fetched.
+
+    Each payload is written to its own file before a line naming it is appended
+    to the journal, so a restarted run only has to fetch the vehicles that are
+    missing from the journal.
+    """
+
+    def __init__(self, filename, folder=CHECKPOINT_FOLDER):
+        self.folder = os.path.join(folder, os.path.splitext(filename)[0])
+        self.journal_path = os.path.join(self.folder, "journal.jsonl")
+        os.makedirs(self.folder, exist_ok=True)
+        self.completed = self._load_journal()
+        if self.completed:
+            print(f"Resuming from checkpoint: {len(self.completed)} vehicles already fetched")
+
+    def _load_journal(self):
+        completed = {}
+        if not os.path.exists(self.journal_path):
+            return completed
+        with open(self.journal_path, "r") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # A torn final line from a killed run
+                if os.path.exists(entry["path"]):
+                    completed[entry["vehicle_id"]] = entry["path"]
+        return completed
+
+    def pending(self, vehicle_ids):
+        """Returns the vehicle IDs that still need to be fetched."""
+        return [vehicle_id for vehicle_id in vehicle_ids if vehicle_id not in self.completed]
+
+    def record(self, vehicle_id, payload):
+        """Durably stores one vehicle's payload and marks it as finished. Only call this for successful fetches."""
+        path = os.path.join(self.folder, f"{vehicle_id}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(payload, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        with open(self.journal_path, "a") as journal:
+            journal.write(json.dumps({"vehicle_id": vehicle_id, "path": path}) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.completed[vehicle_id] = path
+
+    def results(self, vehicle_ids):
+        """Yields (vehicle_id, serialized payload) for every finished vehicle in vehicle-ID order."""
+        for vehicle_id in sorted(set(vehicle_ids)):
+            if vehicle_id in self.completed:
+                with open(self.completed[vehicle_id], "r") as file:
+                    yield vehicle_id, file.read()
+
+    def clear(self):
+        """Removes the checkpoint once the day's file has been saved."""
+        shutil.rmtree(self.folder, ignore_errors=True)
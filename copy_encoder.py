@@ -0,0 +1,110 @@
+import io
+import math
+from itertools import islice
+import numpy as np
+
+# Encodes rows in PostgreSQL's text COPY format (tab-separated, \N for NULL, backslash escapes)
+# and streams them into cursor.copy_expert in chunks, so no value can break a row apart.
+NULL = '\\N'
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+COPY_CHUNK_ROWS = 2000  # Rows encoded and checked together
+COLUMN_CHUNK_ROWS = 50000  # Rows formatted at a time from NumPy columns
+COPY_READ_SIZE = 1 << 16  # Characters handed to the driver per read, at least
+
+
+def encode_value(value, empty_as_null=False):
+    """One field in COPY text format. None and NaN become NULL, as does '' if empty_as_null is set."""
+    if value is None:
+        return NULL
+    if isinstance(value, str):
+        if not value and empty_as_null:
+            return NULL
+        return value.translate(ESCAPES)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (float, np.floating)) and math.isnan(value):
+        return NULL
+    return str(value)
+
+
+def _needs_escaping(text, rows, fields, empty_as_null):
+    """True if str()-joined rows may hold something that is not valid COPY text as-is."""
+    # Tabs and newlines inside values are caught by counting them; an empty field sits between two separators
+    return (text.count('\t') != fields - rows or text.count('\n') != rows or '\\' in text or '\r' in text
+            or 'nan' in text or 'None' in text or 'True' in text or 'False' in text
+            or (empty_as_null and ('\t\t' in text or '\t\n' in text or '\n\t' in text or '\n\n' in text or text[0] in '\t\n')))
+
+
+def encode_rows(rows, empty_as_null=False):
+    """Yields COPY text for rows (sequences of values), COPY_CHUNK_ROWS lines at a time."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, COPY_CHUNK_ROWS))
+        if not batch:
+            return
+        # Fast path: str() every value and check the whole chunk at once; only a chunk that fails is redone row by row
+        lines = ['\t'.join(map(str, row)) for row in batch]
+        text = '\n'.join(lines) + '\n'
+        if _needs_escaping(text, len(batch), sum(map(len, batch)), empty_as_null):
+            for index, row in enumerate(batch):
+                if _needs_escaping(lines[index] + '\n', 1, len(row), empty_as_null):
+                    lines[index] = '\t'.join([encode_value(value, empty_as_null) for value in row])
+            text = '\n'.join(lines) + '\n'
+        yield text
+
+
+def _encode_column(values):
+    """COPY fields for a NumPy column, formatted in one vectorised pass for numeric types."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'b':
+        return np.where(values, 't', 'f').tolist()
+    if values.dtype.kind in 'iu':
+        return values.astype(str).tolist()
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), NULL, values.astype(str)).tolist()
+    return [encode_value(value.item() if isinstance(value, np.generic) else value) for value in values]
+
+
+def encode_columns(columns):
+    """Yields COPY text for equal-length columns (NumPy arrays or sequences), COLUMN_CHUNK_ROWS lines at a time."""
+    length = len(columns[0])
+    for start in range(0, length, COLUMN_CHUNK_ROWS):
+        fields = [_encode_column(column[start:start + COLUMN_CHUNK_ROWS]) for column in columns]
+        yield '\n'.join(map('\t'.join, zip(*fields))) + '\n'
+
+
+class CopyReader(io.TextIOBase):
+    """File-like view over COPY text (lines or multi-line chunks) that copy_expert pulls from.
+
+    Each read joins pieces until it has at least the size asked for, so only
+    about one read's worth of COPY text is held at a time.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size < 0:
+            data = ''.join(self.lines)
+        else:
+            pieces, length = [], 0
+            for piece in self.lines:
+                pieces.append(piece)
+                length += len(piece)
+                if length >= size:
+                    break
+            data = ''.join(pieces)
+        # Newlines inside values are escaped, so every raw newline ends a row
+        self.rows += data.count('\n')
+        return data
+
+
+def copy_lines(cursor, table, columns, lines):
+    """Streams COPY text into table. Returns the number of rows sent."""
+    reader = CopyReader(lines)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", reader, size=COPY_READ_SIZE)
+    return reader.rows
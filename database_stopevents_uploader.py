@@ -1,25 +1,55 @@
+import argparse
 import json
 import os
-import io
 import re
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 from tqdm import tqdm
+from json_stream import iter_vehicles
+from copy_encoder import copy_lines, encode_rows
+from upload_ledger import claim_files, pending_files, prepare_ledger
 
-# Initialize the connection pool
-connection_pool = psycopg2.pool.SimpleConnectionPool(
-    1, 10,
-    dbname="project-DB",
-    user="chase",
-    password="karla",
-    host="34.145.104.158",
-    sslmode="require"
+DB_SETTINGS = {
+    'dbname': "project-DB",
+    'user': "chase",
+    'password': "karla",
+    'host': "34.145.104.158",
+    'sslmode': "require",
+}
+DETAIL_COLUMNS = (
+    'vehicle_number', 'leave_time', 'train', 'route_number', 'direction', 'service_key',
+    'trip_number', 'stop_time', 'arrive_time', 'dwell', 'location_id', 'door', 'lift', 'ons',
+    'offs', 'estimated_load', 'maximum_speed', 'train_mileage', 'pattern_distance',
+    'location_distance', 'x_coordinate', 'y_coordinate', 'data_source',
+    'schedule_status', 'trip_id'
 )
+LEDGER_LOADER = 'stopevents'  # This uploader's rows in the upload_ledger table
+HISTORY_FILE = 'upload_stopevents_history.txt'  # The old text ledger, moved into upload_ledger on the first run
+
+# Register a file's trips with one multi-row insert and COPY all its details in one transaction,
+# instead of an INSERT ... RETURNING and a COPY with their own commits for every trip
+BULK_LOAD = True
+# Only enrich the trips queued by recent loads, with keyed joins, instead of rebuilding the view and updating every trip
+INCREMENTAL_ENRICHMENT = True
+PENDING_RETENTION_DAYS = 7  # Queued trips whose breadcrumbs never arrive are dropped after this
+# The indexes enrich_pending_trips joins on, built once with --build-join-indexes
+JOIN_INDEXES = {
+    'stopevents_trips_trip_name_idx': 'stopevents_trips (trip_name)',
+    'stopevents_details_trip_id_idx': 'stopevents_details (trip_id)',
+}
 
 # Global variable for testing mode
 TESTING = False
 
+# The connection pool is created on first use
+connection_pool = None
+schema_ready = False
+
 def connect_db():
+    global connection_pool
+    if connection_pool is None:
+        connection_pool = psycopg2.pool.SimpleConnectionPool(1, 10, **DB_SETTINGS)
     return connection_pool.getconn()
 
 def close_db(conn):
@@ -34,6 +64,8 @@ def extract_integer_from_string(input_string):
         raise ValueError(f"No integer found in input: {input_string}")
 
 def insert_trip(trip_name):
+    if not ensure_schema():
+        return None
     conn = connect_db()
     try:
         trip_id_int = extract_integer_from_string(trip_name)
@@ -45,6 +77,8 @@ def insert_trip(trip_name):
             """
             cursor.execute(query, (trip_id_int,))
             trip_id = cursor.fetchone()[0]
+            if INCREMENTAL_ENRICHMENT:
+                queue_for_enrichment(cursor, [trip_id_int])
             conn.commit()
             if TESTING:
                 print(f"Executed SQL: {cursor.query.decode()}")  # Print the SQL query
@@ -55,28 +89,18 @@ def insert_trip(trip_name):
     finally:
         close_db(conn)
 
+def detail_lines(details, trip_id):
+    """COPY lines for a trip's stop events; empty cells in the scraped tables load as NULL."""
+    fields = DETAIL_COLUMNS[:-1]
+    return encode_rows(([detail.get(field) for field in fields] + [trip_id] for detail in details), empty_as_null=True)
+
 def insert_stopevents_details(details, trip_id):
     conn = connect_db()
     if not TESTING:
         # Use copy_from for bulk insertion
         try:
-            buffer = io.StringIO()
-            for detail in details:
-                buffer.write(
-                    f"{detail['vehicle_number']},{detail['leave_time']},{detail['train']},{detail['route_number']},{detail['direction']},{detail['service_key']},"
-                    f"{detail['trip_number']},{detail['stop_time']},{detail['arrive_time']},{detail['dwell']},{detail['location_id']},{detail['door']},{detail['lift']},"
-                    f"{detail['ons']},{detail['offs']},{detail['estimated_load']},{detail['maximum_speed']},{detail['train_mileage']},{detail['pattern_distance']},"
-                    f"{detail['location_distance']},{detail['x_coordinate']},{detail['y_coordinate']},{detail['data_source']},{detail['schedule_status']},{trip_id}\n"
-                )
-            buffer.seek(0)
             with conn.cursor() as cursor:
-                cursor.copy_from(buffer, 'stopevents_details', sep=',', columns=(
-                    'vehicle_number', 'leave_time', 'train', 'route_number', 'direction', 'service_key',
-                    'trip_number', 'stop_time', 'arrive_time', 'dwell', 'location_id', 'door', 'lift', 'ons',
-                    'offs', 'estimated_load', 'maximum_speed', 'train_mileage', 'pattern_distance',
-                    'location_distance', 'x_coordinate', 'y_coordinate', 'data_source',
-                    'schedule_status', 'trip_id'
-                ))
+                copy_lines(cursor, 'stopevents_details', DETAIL_COLUMNS, detail_lines(details, trip_id))
                 conn.commit()
             return True
         except psycopg2.Error as e:
@@ -136,15 +160,29 @@ def insert_stopevents_details(details, trip_id):
             close_db(conn)
 
 def update_history(filepath):
-    with open('upload_stopevents_history.txt', 'a') as history_file:
-        history_file.write(filepath + '\n')
+    """Records one file in the upload ledger in its own transaction (the per-trip path; bulk loads record in theirs)."""
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            claim_files(cursor, LEDGER_LOADER, [filepath])
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error recording upload of {filepath}: {e}")
+    finally:
+        close_db(conn)
 
-def load_history():
+def load_history(filepaths):
+    """Returns the filepaths the upload ledger does not have, migrating HISTORY_FILE into it first if present."""
+    conn = connect_db()
     try:
-        with open('upload_stopevents_history.txt', 'r') as history_file:
-            return set(history_file.read().splitlines())
-    except FileNotFoundError:
-        return set()
+        prepare_ledger(conn, LEDGER_LOADER, HISTORY_FILE)
+        with conn.cursor() as cursor:
+            pending = pending_files(cursor, LEDGER_LOADER, filepaths)
+        conn.commit()
+        return pending
+    finally:
+        close_db(conn)
 
 def execute_sql_query():
     sql_query = """
@@ -202,63 +240,308 @@ def execute_sql_query():
     finally:
         close_db(conn)
 
+def ensure_schema():
+    """Creates the enrichment trigger, view and queue table if they are missing. Runs once per process.
+
+    Returns False, after printing the error, if that fails. The join indexes
+    are left to build_join_indexes, since building them locks large tables.
+    """
+    global schema_ready
+    if schema_ready:
+        return True
+    sql_query = """
+    CREATE TABLE IF NOT EXISTS trip_enrichment_pending (
+       trip_name integer PRIMARY KEY,
+       queued_at timestamp NOT NULL DEFAULT now()
+    );
+
+    DO $do$
+    BEGIN
+       IF to_regprocedure('trip_update()') IS NULL THEN
+          CREATE FUNCTION trip_update() RETURNS trigger AS $$
+          BEGIN
+             RAISE NOTICE 'Trip table has been updated';
+             RETURN NEW;
+          END;
+          $$ LANGUAGE plpgsql;
+       END IF;
+
+       IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trip_update' AND tgrelid = 'public.trip'::regclass) THEN
+          CREATE TRIGGER trip_update
+          AFTER UPDATE ON public.trip
+          FOR EACH ROW
+          EXECUTE FUNCTION trip_update();
+       END IF;
+
+       IF to_regclass('integratedtripdata') IS NULL THEN
+          CREATE VIEW integratedtripdata AS
+          SELECT DISTINCT
+             b.trip_id AS trip_id,
+             CAST(s.route_number AS integer) AS route_id,
+             CAST(s.vehicle_number AS integer) AS vehicle_id,
+             CASE
+                 WHEN s.service_key = 'U' THEN 'Sunday'
+                 WHEN s.service_key = 'A' THEN 'Saturday'
+                 ELSE 'Weekday'
+             END AS service_key,
+             CAST(s.direction AS BOOLEAN) AS direction
+          FROM BreadCrumb b
+          JOIN stopevents_trips AS st ON b.trip_id = st.trip_name
+          JOIN stopevents_details AS s ON st.trip_id = s.trip_id
+          WHERE s.service_key IN ('U', 'W', 'A');
+       END IF;
+    END
+    $do$;
+    """
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql_query)
+        conn.commit()
+        schema_ready = True
+        return True
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating the enrichment schema: {e}")
+        return False
+    finally:
+        close_db(conn)
+
+def build_join_indexes():
+    """Builds JOIN_INDEXES with CREATE INDEX CONCURRENTLY, so loads carry on meanwhile. Returns True if all are in place.
+
+    An index that a failed build left invalid is dropped and built again.
+    """
+    try:
+        conn = psycopg2.connect(**DB_SETTINGS)
+    except psycopg2.Error as e:
+        print(f"Error connecting to build the join indexes: {e}")
+        return False
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    try:
+        with conn.cursor() as cursor:
+            for name, target in JOIN_INDEXES.items():
+                cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+                row = cursor.fetchone()
+                if row is not None and row[0]:
+                    print(f"Index {name} already exists")
+                    continue
+                if row is not None:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY {name}")
+                cursor.execute(f"CREATE INDEX CONCURRENTLY {name} ON {target}")
+                print(f"Built index {name}")
+        return True
+    except psycopg2.Error as e:
+        print(f"Error building the join indexes: {e}")
+        return False
+    finally:
+        conn.close()
+
+def queue_for_enrichment(cursor, trip_names):
+    """Queues trips for enrich_pending_trips, in the caller's transaction."""
+    cursor.execute(
+        """
+        INSERT INTO trip_enrichment_pending (trip_name)
+        SELECT DISTINCT unnest(%s::integer[])
+        ON CONFLICT (trip_name) DO UPDATE SET queued_at = now()
+        """,
+        (list(trip_names),)
+    )
+
+def enrich_pending_trips():
+    """Copies route, vehicle, service key and direction from stop events onto the queued trips.
+
+    Only queued trips are joined, by key, so the cost follows the new data
+    rather than the history. A trip stays queued until its breadcrumb trip
+    row exists, for PENDING_RETENTION_DAYS at most. Returns the number of
+    trips updated.
+    """
+    sql_query = """
+    WITH resolved AS (
+       UPDATE trip
+       SET
+          route_id = it.route_id,
+          vehicle_id = it.vehicle_id,
+          service_key = it.service_key,
+          direction = it.direction
+       FROM (
+          SELECT DISTINCT
+             st.trip_name AS trip_id,
+             CAST(s.route_number AS integer) AS route_id,
+             CAST(s.vehicle_number AS integer) AS vehicle_id,
+             CASE
+                 WHEN s.service_key = 'U' THEN 'Sunday'
+                 WHEN s.service_key = 'A' THEN 'Saturday'
+                 ELSE 'Weekday'
+             END AS service_key,
+             CAST(s.direction AS BOOLEAN) AS direction
+          FROM trip_enrichment_pending AS p
+          JOIN stopevents_trips AS st ON st.trip_name = p.trip_name
+          JOIN stopevents_details AS s ON st.trip_id = s.trip_id
+          WHERE s.service_key IN ('U', 'W', 'A')
+       ) AS it
+       WHERE trip.trip_id = it.trip_id
+       RETURNING trip.trip_id
+    ), dequeued AS (
+       DELETE FROM trip_enrichment_pending AS p
+       USING resolved
+       WHERE p.trip_name = resolved.trip_id
+    )
+    SELECT count(*) FROM resolved;
+    """
+    if not ensure_schema():
+        return 0
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql_query)
+            updated = cursor.fetchone()[0]
+            cursor.execute(
+                "DELETE FROM trip_enrichment_pending WHERE queued_at < now() - make_interval(days => %s)",
+                (PENDING_RETENTION_DAYS,)
+            )
+        conn.commit()
+        if TESTING:
+            print(f"Enriched {updated} trips.")
+        return updated
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error enriching trips: {e}")
+        return 0
+    finally:
+        close_db(conn)
+
+def iter_file_trips(filepath):
+    """Yields (trip_name, details) for every trip of every vehicle in a stop events day file."""
+    for vehicle_number, trip_data in iter_vehicles(filepath):
+        if isinstance(trip_data, str):
+            try:
+                trip_data = json.loads(trip_data)
+            except json.JSONDecodeError:
+                print(f"Failed to decode trip_data: {trip_data[:100]}")
+                continue
+
+        if not isinstance(trip_data, list):
+            print(f"Unexpected data type for trip_data after attempt to parse: {type(trip_data)}")
+            continue
+        if TESTING:
+            trip_data = trip_data[:1]  # Only process the first entry in TESTING mode
+
+        for trip in trip_data:
+            trip_name = trip.get('trip')
+            details = trip.get('data', [])
+            if trip_name and isinstance(details, list):
+                yield trip_name, details[:1] if TESTING else details
+            else:
+                print(f"Unexpected structure in trip_data: {trip}")
+
+def iter_file_trip_ids(filepath, report_errors=True):
+    """Yields (trip_name as an integer, details) for each trip in a stop events day file whose name has a number."""
+    for trip_name, details in iter_file_trips(filepath):
+        try:
+            yield extract_integer_from_string(trip_name), details
+        except ValueError as e:
+            if report_errors:
+                print(f"Error processing trip name '{trip_name}': {e}")
+
+def load_file(filepath):
+    """Uploads one stop events day file in a single transaction.
+
+    The file is streamed twice, so memory follows the largest vehicle: the
+    first pass only collects the trip names and registers them with one
+    multi-row INSERT ... RETURNING, the second sends every detail row through
+    one COPY. Like the per-trip path, each trip in the file gets its own row,
+    even if its name repeats. The file is recorded in the upload ledger in the
+    same transaction. Returns the number of detail rows (0 if another run
+    already loaded the file), or None on failure.
+    """
+    trip_names = [trip_name for trip_name, _ in iter_file_trip_ids(filepath)]
+    if not trip_names:
+        return 0
+
+    if not ensure_schema():
+        return None
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            if not claim_files(cursor, LEDGER_LOADER, [filepath]):
+                conn.rollback()
+                return 0
+            returned = execute_values(
+                cursor,
+                "INSERT INTO stopevents_trips (trip_name) VALUES %s RETURNING trip_id, trip_name",
+                [(trip_name,) for trip_name in trip_names],
+                page_size=len(trip_names),
+                fetch=True
+            )
+            # Rows with the same name are interchangeable, so each occurrence just takes the next of its IDs
+            trip_ids = {}
+            for trip_id, trip_name in sorted(returned):
+                trip_ids.setdefault(int(trip_name), []).append(trip_id)
+            for ids in trip_ids.values():
+                ids.reverse()
+            if INCREMENTAL_ENRICHMENT:
+                queue_for_enrichment(cursor, trip_ids)
+
+            lines = (line for trip_name, details in iter_file_trip_ids(filepath, report_errors=False)
+                     for line in detail_lines(details, trip_ids[trip_name].pop()))
+            rows = copy_lines(cursor, 'stopevents_details', DETAIL_COLUMNS, lines)
+        conn.commit()
+        return rows
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Database error loading {os.path.basename(filepath)}: {e}")
+        return None
+    finally:
+        close_db(conn)
+
+def process_file(filepath):
+    """Uploads one day file trip by trip, each with its own commits (the path used when BULK_LOAD is off)."""
+    filename = os.path.basename(filepath)
+    for trip_name, details in iter_file_trips(filepath):
+        try:
+            trip_id = insert_trip(trip_name)
+            if trip_id is not None:
+                details_success = insert_stopevents_details(details, trip_id)
+                if not details_success:
+                    print(f"Failed to insert stopevents details for file: {filename}")
+                    break  # Exit if any insert fails to prevent further processing
+            else:
+                print(f"Failed to insert trip for file: {filename}")
+                break  # Exit if any insert fails to prevent further processing
+        except ValueError as e:
+            print(f"Error processing trip name '{trip_name}': {e}")
+    else:
+        # Recorded once, after every trip went in
+        update_history(filepath)
+
 def process_json_files(directory):
-    uploaded_files = load_history()
     files = os.listdir(directory)
     if TESTING:
         files = files[:1]  # Only process the first file for testing
 
-    for filename in tqdm(files, desc="Processing JSON files"):
-        if filename.endswith('.json'):
-            filepath = os.path.join(directory, filename)
-            if filepath not in uploaded_files:
-                with open(filepath, 'r') as file:
-                    data = json.load(file)
-
-                    for vehicle_number, trip_data in data.items():
-                        if isinstance(trip_data, str):
-                            try:
-                                trip_data = json.loads(trip_data)
-                            except json.JSONDecodeError:
-                                print(f"Failed to decode trip_data: {trip_data[:100]}")
-                                continue
-
-                        if isinstance(trip_data, list):
-                            if TESTING:
-                                trip_data = trip_data[:1]  # Only process the first entry in TESTING mode
-
-                            for trip in trip_data:
-                                trip_name = trip.get('trip')
-                                details = trip.get('data', [])
-
-                                if trip_name and isinstance(details, list):
-                                    try:
-                                        trip_id = insert_trip(trip_name)
-                                        if trip_id is not None:
-                                            if TESTING:
-                                                details = details[:1]
-                                            
-                                            details_success = insert_stopevents_details(details, trip_id)
-                                            if details_success:
-                                                update_history(filepath)
-                                            else:
-                                                print(f"Failed to insert stopevents details for file: {filename}")
-                                                break  # Exit if any insert fails to prevent further processing
-                                        else:
-                                            print(f"Failed to insert trip for file: {filename}")
-                                            break  # Exit if any insert fails to prevent further processing
-                                    except ValueError as e:
-                                        print(f"Error processing trip name '{trip_name}': {e}")
-                                else:
-                                    print(f"Unexpected structure in trip_data: {trip}")
-                        else:
-                            print(f"Unexpected data type for trip_data after attempt to parse: {type(trip_data)}")
-                    if TESTING:
-                        break  # Stop processing further vehicles in TESTING mode
+    filepaths = load_history([os.path.join(directory, filename) for filename in files
+                              if filename.endswith(('.json', '.json.gz'))])
+    for filepath in tqdm(filepaths, desc="Processing JSON files"):
+        if not BULK_LOAD:
+            process_file(filepath)
+        elif load_file(filepath) is None:
+            print(f"Failed to load stop events file: {os.path.basename(filepath)}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Upload stop events day files to the database and enrich their trips.")
+    parser.add_argument('--build-join-indexes', action='store_true',
+                        help="Build the indexes the trip enrichment joins on, concurrently, then exit")
+    args = parser.parse_args()
+    if args.build_join_indexes:
+        build_join_indexes()
+        return
     process_json_files('downloaded_stopevents_jsons')
-    execute_sql_query()
+    if INCREMENTAL_ENRICHMENT:
+        enrich_pending_trips()
+    else:
+        execute_sql_query()
+
 if __name__ == "__main__":
     main()
 
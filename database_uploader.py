@@ -1,128 +1,274 @@
+import argparse
 import json
 import os
-import io
+import numpy as np
+import threading
 import psycopg2
+import psycopg2.errors
 from psycopg2 import pool
+from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tqdm import tqdm
+from cleaned_format import epoch_to_iso, read_npz
+from copy_encoder import copy_lines, encode_columns, encode_rows
+from upload_ledger import claim_files, pending_files, prepare_ledger
 
-# Initialize the connection pool
-connection_pool = psycopg2.pool.SimpleConnectionPool(
-    1, 10,
-    dbname="project-DB",
-    user="will",
-    password="karlasgremlins",
-    host="34.145.104.158",
-    sslmode="require"
-)
+DB_SETTINGS = {
+    'dbname': "project-DB",
+    'user': "will",
+    'password': "karlasgremlins",
+    'host': "34.145.104.158",
+    'sslmode': "require",
+}
+BREADCRUMB_COLUMNS = ('tstamp', 'latitude', 'longitude', 'speed', 'trip_id')
+LEDGER_LOADER = 'breadcrumbs'  # This uploader's rows in the upload_ledger table
+HISTORY_FILE = 'upload_history.txt'  # The old text ledger, moved into upload_ledger on the first run
+
+# Load many cleaned files per transaction, over several connections, instead of two commits per file
+BULK_LOAD = True
+BATCH_FILES = 50  # Cleaned files per transaction
+LOAD_WORKERS = 4  # Concurrent connections, each loading its own batches; at most the pool size
+# Skip breadcrumbs already stored on (trip_id, tstamp), so reloading a file adds nothing: COPY straight into
+# breadcrumb under a savepoint, and only if that hits the unique key COPY into a temp staging table and merge.
+# Off by default: turn on only after building the unique index once with --build-breadcrumb-key
+MERGE_LOAD = False
+BREADCRUMB_KEY_INDEX = 'breadcrumb_trip_id_tstamp_key'
 
 # Global variable for testing mode
 TESTING = False
 
+# The connection pool is created on first use; threaded because bulk-load workers share it
+connection_pool = None
+pool_lock = threading.Lock()
+
 def connect_db():
+    global connection_pool
+    with pool_lock:
+        if connection_pool is None:
+            connection_pool = psycopg2.pool.ThreadedConnectionPool(1, 10, **DB_SETTINGS)
     return connection_pool.getconn()
 
 def close_db(conn):
     connection_pool.putconn(conn)
 
-def insert_trip(trip_info):
+def breadcrumb_lines(breadcrumbs, trip_id):
+    """COPY lines for a cleaned file's breadcrumbs, given as a list of dicts or as .npz columns."""
+    if isinstance(breadcrumbs, dict):
+        count = len(breadcrumbs['tstamp'])
+        return encode_columns([epoch_to_iso(breadcrumbs['tstamp']), breadcrumbs['latitude'], breadcrumbs['longitude'],
+                               breadcrumbs['speed'], np.full(count, trip_id)])
+    return encode_rows((breadcrumb['tstamp'], breadcrumb['latitude'], breadcrumb['longitude'], breadcrumb['speed'], trip_id)
+                       for breadcrumb in breadcrumbs)
+
+def breadcrumb_key_valid(cursor):
+    """True if the unique (trip_id, tstamp) index exists and is usable, False if a failed build left it invalid, None if missing."""
+    cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s) AND indisunique",
+                   (BREADCRUMB_KEY_INDEX,))
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+def check_breadcrumb_key():
+    """Raises if the unique index the merge relies on is missing; the loader never builds it itself."""
     conn = connect_db()
     try:
         with conn.cursor() as cursor:
-            # Debugging output
-            #print(f"Attempting to insert trip with Trip ID: {trip_info['trip_id']}")
-            
-            # Insert a new trip, ignore if it exists
+            valid = breadcrumb_key_valid(cursor)
+        conn.rollback()
+    finally:
+        close_db(conn)
+    if not valid:
+        state = "is invalid" if valid is False else "is missing"
+        raise RuntimeError(f"Unique index {BREADCRUMB_KEY_INDEX} on breadcrumb (trip_id, tstamp) {state}; "
+                           f"run 'python database_uploader.py --build-breadcrumb-key' first, or turn MERGE_LOAD off")
+
+def build_breadcrumb_key():
+    """Deletes duplicate breadcrumbs, then builds the unique (trip_id, tstamp) index the merge relies on.
+
+    Of each set of duplicates the first row stored is kept. The index is built
+    CONCURRENTLY so loads and queries carry on meanwhile; if the build fails it
+    leaves an invalid index, which the next run drops before trying again.
+    """
+    conn = psycopg2.connect(**DB_SETTINGS)
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    try:
+        with conn.cursor() as cursor:
+            valid = breadcrumb_key_valid(cursor)
+            if valid:
+                print(f"Index {BREADCRUMB_KEY_INDEX} already exists")
+                return
+            if valid is False:
+                cursor.execute(f"DROP INDEX CONCURRENTLY {BREADCRUMB_KEY_INDEX}")
             cursor.execute(
                 """
-                INSERT INTO trip (trip_id, route_id, vehicle_id, service_key, direction)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (trip_id) DO NOTHING
-                """,
-                (trip_info['trip_id'], trip_info['route_id'], trip_info['vehicle_id'],
-                 trip_info['service_key'], trip_info['direction'])
+                DELETE FROM breadcrumb AS duplicate
+                USING breadcrumb AS original
+                WHERE duplicate.trip_id = original.trip_id
+                  AND duplicate.tstamp = original.tstamp
+                  AND duplicate.ctid > original.ctid
+                """
             )
-            conn.commit()
-        return True
-    except psycopg2.Error as e:
-        print(f"Error inserting trip (Trip ID: {trip_info['trip_id']}): {e}")
-        return False
+            print(f"Deleted {cursor.rowcount} duplicate breadcrumbs")
+            cursor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY {BREADCRUMB_KEY_INDEX} ON breadcrumb (trip_id, tstamp)")
+            print(f"Built index {BREADCRUMB_KEY_INDEX}")
     finally:
-        close_db(conn)
+        conn.close()
 
-def insert_breadcrumbs(breadcrumbs, trip_id):
-    conn = connect_db()
-    try:
-        buffer = io.StringIO()
-        for breadcrumb in breadcrumbs:
-            buffer.write(f"{breadcrumb['tstamp']},{breadcrumb['latitude']},{breadcrumb['longitude']},{breadcrumb['speed']},{trip_id}\n")
+def copy_breadcrumbs(cursor, lines):
+    """Streams breadcrumb COPY text in the caller's transaction. Returns the number of rows added.
 
-        buffer.seek(0)
+    lines is a function returning a fresh iterable of COPY text, so the rows
+    can be sent a second time without having been held in memory. With
+    MERGE_LOAD, rows whose (trip_id, tstamp) is already in breadcrumb are
+    skipped. A first load goes straight into breadcrumb under a savepoint; only
+    if that hits the unique key are the rows sent again, to a temp staging
+    table, and merged.
+    """
+    if not MERGE_LOAD:
+        return copy_lines(cursor, 'breadcrumb', BREADCRUMB_COLUMNS, lines())
+    cursor.execute("SAVEPOINT breadcrumb_copy")
+    try:
+        rows = copy_lines(cursor, 'breadcrumb', BREADCRUMB_COLUMNS, lines())
+        cursor.execute("RELEASE SAVEPOINT breadcrumb_copy")
+        return rows
+    except psycopg2.errors.UniqueViolation:
+        cursor.execute("ROLLBACK TO SAVEPOINT breadcrumb_copy")
+    # Temp tables skip the WAL like unlogged ones and are private to the connection, so workers never share one
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS breadcrumb_staging (LIKE breadcrumb) ON COMMIT DELETE ROWS")
+    copy_lines(cursor, 'breadcrumb_staging', BREADCRUMB_COLUMNS, lines())
+    cursor.execute(
+        f"""
+        INSERT INTO breadcrumb ({', '.join(BREADCRUMB_COLUMNS)})
+        SELECT {', '.join(BREADCRUMB_COLUMNS)} FROM breadcrumb_staging
+        ON CONFLICT (trip_id, tstamp) DO NOTHING
+        """
+    )
+    return cursor.rowcount
 
-        # Debugging output
-        #print(f"Attempting to insert breadcrumbs for Trip ID: {trip_id}")
-        
+def load_history(filepaths):
+    """Returns the filepaths the upload ledger does not have, migrating HISTORY_FILE into it first if present."""
+    conn = connect_db()
+    try:
+        prepare_ledger(conn, LEDGER_LOADER, HISTORY_FILE)
         with conn.cursor() as cursor:
-            cursor.copy_from(buffer, 'breadcrumb', sep=',', columns=('tstamp', 'latitude', 'longitude', 'speed', 'trip_id'))
-            conn.commit()
-        return True
-    except psycopg2.Error as e:
-        print(f"Database error (Trip ID: {trip_id}): {e}")
-        return False
+            pending = pending_files(cursor, LEDGER_LOADER, filepaths)
+        conn.commit()
+        return pending
     finally:
         close_db(conn)
 
-def update_history(filepath):
-    with open('upload_history.txt', 'a') as history_file:
-        history_file.write(filepath + '\n')
+def read_cleaned_file(filepath):
+    """Returns (trip_info, breadcrumbs, consistent) for a cleaned .json or .npz file."""
+    if filepath.endswith('.npz'):
+        # Typed columns written by json_cleanup.py --format npz
+        trip_info, columns = read_npz(filepath)
+        return trip_info, columns, bool((columns['trip_id'] == trip_info['trip_id']).all())
+    with open(filepath, 'r') as file:
+        data = json.load(file)
+    trip_info = data['trip_info']
+    breadcrumbs = data['breadcrumbs']
+    return trip_info, breadcrumbs, all(breadcrumb['trip_id'] == trip_info['trip_id'] for breadcrumb in breadcrumbs)
+
+def process_file(filepath):
+    """Uploads one cleaned file in its own transaction, ledger row included (the path used when BULK_LOAD is off)."""
+    loaded, _ = load_batch([filepath])
+    if not loaded:
+        print(f"Failed to upload file: {os.path.basename(filepath)}")
+
+def batch_lines(filepaths):
+    """COPY text for the breadcrumbs of cleaned files, reading one file at a time."""
+    for filepath in filepaths:
+        trip_info, breadcrumbs, _ = read_cleaned_file(filepath)
+        yield from breadcrumb_lines(breadcrumbs, trip_info['trip_id'])
+
+def load_batch(filepaths):
+    """Uploads a batch of cleaned files in one transaction: one multi-row trip insert and one COPY.
 
-def load_history():
+    The files are read twice, so only one is held at a time: first for the
+    trips and the trip_id check, then again as the COPY streams. They are
+    recorded in the upload ledger in the same transaction, and any that
+    another run recorded meanwhile are left out. Returns (loaded file paths,
+    breadcrumb rows added). Nothing is kept if any statement fails.
+    """
+    trips = {}
+    for filepath in filepaths:
+        trip_info, _, consistent_trip_id = read_cleaned_file(filepath)
+        if not consistent_trip_id:
+            print(f"Inconsistent trip_ids found in file: {os.path.basename(filepath)}")
+            continue
+        trips[filepath] = trip_info
+    if not trips:
+        return [], 0
+
+    conn = connect_db()
     try:
-        with open('upload_history.txt', 'r') as history_file:
-            return set(history_file.read().splitlines())
-    except FileNotFoundError:
-        return set()
+        with conn.cursor() as cursor:
+            loaded = claim_files(cursor, LEDGER_LOADER, list(trips))
+            if not loaded:
+                conn.rollback()
+                return [], 0
+            trip_rows = {}
+            for filepath in loaded:
+                trip_rows.setdefault(trips[filepath]['trip_id'], trips[filepath])
+
+            # Trips go first in the same transaction to satisfy the breadcrumb foreign key
+            execute_values(
+                cursor,
+                """
+                INSERT INTO trip (trip_id, route_id, vehicle_id, service_key, direction)
+                VALUES %s
+                ON CONFLICT (trip_id) DO NOTHING
+                """,
+                [(trip['trip_id'], trip['route_id'], trip['vehicle_id'], trip['service_key'], trip['direction'])
+                 for trip in trip_rows.values()]
+            )
+            rows = copy_breadcrumbs(cursor, lambda: batch_lines(loaded))
+        conn.commit()
+        return loaded, rows
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Database error loading {len(filepaths)} files starting at {os.path.basename(filepaths[0])}: {e}")
+        return [], 0
+    finally:
+        close_db(conn)
 
-def process_json_files(directory):
-    uploaded_files = load_history()
+def process_json_files(directory, batch_files=BATCH_FILES, workers=LOAD_WORKERS):
     files = os.listdir(directory)
     if TESTING:
         files = files[:1]  # Only process the first file for testing
 
-    for filename in tqdm(files, desc="Processing JSON files"):
-        if filename.endswith('.json'):
-            filepath = os.path.join(directory, filename)
-            if filepath not in uploaded_files:
-                with open(filepath, 'r') as file:
-                    data = json.load(file)
-
-                    trip_info = data['trip_info']
-                    breadcrumbs = data['breadcrumbs']
-
-                    # Ensure consistent trip_id across trip_info and breadcrumbs
-                    consistent_trip_id = all(breadcrumb['trip_id'] == trip_info['trip_id'] for breadcrumb in breadcrumbs)
-                    if not consistent_trip_id:
-                        print(f"Inconsistent trip_ids found in file: {filename}")
-                        continue
-
-                    # Insert the trip first to satisfy foreign key constraints
-                    trip_success = insert_trip(trip_info)
-
-                    # Insert breadcrumbs if trip insertion was successful
-                    if trip_success:
-                        breadcrumbs_success = insert_breadcrumbs(breadcrumbs, trip_info['trip_id'])
-                        if breadcrumbs_success:
-                            # Update the history record only if both inserts are successful
-                            update_history(filepath)
-                        else:
-                            print(f"Failed to insert breadcrumbs for file: {filename}")
-                    else:
-                        print(f"Failed to insert trip for file: {filename}")
+    filepaths = load_history([os.path.join(directory, filename) for filename in sorted(files)
+                              if filename.endswith(('.json', '.npz'))])
+    if MERGE_LOAD and filepaths:
+        check_breadcrumb_key()
+
+    if not BULK_LOAD:
+        for filepath in tqdm(filepaths, desc="Processing JSON files"):
+            process_file(filepath)
+        return
+
+    batches = [filepaths[i:i + batch_files] for i in range(0, len(filepaths), batch_files)]
+    total_rows = 0
+    pbar = tqdm(total=len(filepaths), desc="Loading JSON files")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch, (loaded, rows) in zip(batches, executor.map(load_batch, batches)):
+            if len(loaded) < len(batch):
+                print(f"Did not load {len(batch) - len(loaded)} of {len(batch)} files in batch")
+            total_rows += rows
+            pbar.update(len(batch))
+            pbar.set_description(f"Loaded {total_rows} breadcrumbs")
+    pbar.close()
 
 def main():
+    parser = argparse.ArgumentParser(description="Upload cleaned breadcrumb files to the database.")
+    parser.add_argument('--build-breadcrumb-key', action='store_true',
+                        help="Delete duplicate breadcrumbs and build the unique (trip_id, tstamp) index MERGE_LOAD needs, then exit")
+    args = parser.parse_args()
+    if args.build_breadcrumb_key:
+        build_breadcrumb_key()
+        return
     # Assuming your cleaned JSON files are in the 'cleaned_jsons' directory
     process_json_files('cleaned_jsons')
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+# Defaults shared by the collectors
+REQUESTS_PER_SECOND = 5
+MAX_IN_FLIGHT = 8
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+REQUEST_TIMEOUT = 60
+
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out at most `rate` tokens per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Returns an exponential backoff delay with full jitter for the given failed attempt."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def make_session(max_in_flight=MAX_IN_FLIGHT):
+    """Creates a keep-alive session whose connection pool fits every in-flight request."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_one(session, bucket, url, parse, max_attempts=MAX_ATTEMPTS):
+    """Fetches a single URL, retrying failures with backoff. Returns None if every attempt fails."""
+    for attempt in range(1, max_attempts + 1):
+        bucket.acquire()
+        try:
+            response = session.get(url, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 200:
+                return parse(response)
+        except requests.RequestException:
+            pass
+        if attempt < max_attempts:
+            time.sleep(backoff_delay(attempt))
+    return None
+
+
+def fetch_vehicles(vehicle_ids, url_template, parse, rate=REQUESTS_PER_SECOND,
+                   max_in_flight=MAX_IN_FLIGHT, max_attempts=MAX_ATTEMPTS, desc="Processing vehicle IDs"):
+    """Fetches every vehicle concurrently and yields (vehicle_id, payload) pairs as they complete.
+
+    Vehicles whose fetch fails after `max_attempts` are yielded with a None
+    payload, so callers can tell them apart from vehicles with no data.
+    """
+    bucket = TokenBucket(rate)
+    vehicle_ids = list(dict.fromkeys(vehicle_ids))
+    with make_session(max_in_flight) as session, ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {
+            executor.submit(fetch_one, session, bucket, url_template.format(vehicle_id=vehicle_id), parse, max_attempts): vehicle_id
+            for vehicle_id in vehicle_ids
+        }
+        for future in tqdm(as_completed(futures), desc=desc, total=len(futures)):
+            # Drop the finished future so its payload can be freed once the caller is done with it
+            vehicle_id = futures.pop(future)
+            yield vehicle_id, future.result()
@@ -1,13 +1,20 @@
 import json
 import os
-from datetime import datetime, timedelta
 from tqdm import tqdm
 import psutil
-import gc  # Import garbage collection module
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from json_stream import iter_vehicles
+from cleaned_format import breadcrumbs_to_columns, write_npz
+from timestamp_decoder import parse_opd_date, to_isoformat
+from processing_manifest import ProcessingManifest
 
 # Constants
 INPUT_FOLDER = 'downloaded_jsons'
 OUTPUT_FOLDER = 'cleaned_jsons'
+OUTPUT_FORMAT = 'json'  # 'json' (pretty-printed) or 'npz' (typed NumPy columns)
+OUTPUT_FORMATS = ('json', 'npz')
+MANIFEST_SUFFIX = '.manifest.sqlite'  # The manifest sits beside OUTPUT_FOLDER (cleaned_jsons.manifest.sqlite)
 TESTING = False
 
 def log_memory_usage():
@@ -17,37 +24,53 @@ def log_memory_usage():
     print(f"Memory used: {mem_info.rss / (1024 * 1024)} MB")
 
 def parse_date(opd_date):
-    """Parses the OPD_DATE string into a datetime object."""
-    return datetime.strptime(opd_date, '%d%b%Y:%H:%M:%S')
+    """Parses the OPD_DATE string into a datetime object (cached per distinct string)."""
+    return parse_opd_date(opd_date)
+
+def has_gps(event):
+    """Returns True if the event has both GPS coordinates."""
+    return event['GPS_LONGITUDE'] is not None and event['GPS_LATITUDE'] is not None
 
 def impute_gps_coordinates(events):
-    """Imputes missing GPS coordinates using linear interpolation."""
+    """Imputes missing GPS coordinates using linear interpolation.
+
+    Runs in linear time: a backward pass finds the next valid event for every
+    position, then a forward pass fills gaps in order. By the time a gap is
+    reached the event before it is valid (original or already imputed), so it
+    serves as the previous neighbour.
+    """
+    next_valid = [None] * len(events)
+    upcoming = None
+    for i in range(len(events) - 1, -1, -1):
+        if has_gps(events[i]):
+            upcoming = events[i]
+        next_valid[i] = upcoming
+
     for i, event in enumerate(events):
-        if event['GPS_LONGITUDE'] is None or event['GPS_LATITUDE'] is None:
-            prev_event = None
-            next_event = None
-            for j in range(i - 1, -1, -1):
-                if events[j]['GPS_LONGITUDE'] is not None and events[j]['GPS_LATITUDE'] is not None:
-                    prev_event = events[j]
-                    break
-            for k in range(i + 1, len(events)):
-                if events[k]['GPS_LONGITUDE'] is not None and events[k]['GPS_LATITUDE'] is not None:
-                    next_event = events[k]
-                    break
-
-            if prev_event and next_event:
-                time_ratio = (event['ACT_TIME'] - prev_event['ACT_TIME']) / (next_event['ACT_TIME'] - prev_event['ACT_TIME'])
-                event['GPS_LONGITUDE'] = prev_event['GPS_LONGITUDE'] + time_ratio * (next_event['GPS_LONGITUDE'] - prev_event['GPS_LONGITUDE'])
-                event['GPS_LATITUDE'] = prev_event['GPS_LATITUDE'] + time_ratio * (next_event['GPS_LATITUDE'] - prev_event['GPS_LATITUDE'])
-            elif prev_event:
+        if has_gps(event):
+            continue
+        prev_event = events[i - 1] if i > 0 else None
+        next_event = next_valid[i]
+
+        if prev_event and next_event:
+            time_span = next_event['ACT_TIME'] - prev_event['ACT_TIME']
+            if time_span == 0:
+                # Both neighbours share an ACT_TIME; nothing to interpolate between
                 event['GPS_LONGITUDE'] = prev_event['GPS_LONGITUDE']
                 event['GPS_LATITUDE'] = prev_event['GPS_LATITUDE']
-            elif next_event:
-                event['GPS_LONGITUDE'] = next_event['GPS_LONGITUDE']
-                event['GPS_LATITUDE'] = next_event['GPS_LATITUDE']
-            else:
-                event['GPS_LONGITUDE'] = 0
-                event['GPS_LATITUDE'] = 0
+                continue
+            time_ratio = (event['ACT_TIME'] - prev_event['ACT_TIME']) / time_span
+            event['GPS_LONGITUDE'] = prev_event['GPS_LONGITUDE'] + time_ratio * (next_event['GPS_LONGITUDE'] - prev_event['GPS_LONGITUDE'])
+            event['GPS_LATITUDE'] = prev_event['GPS_LATITUDE'] + time_ratio * (next_event['GPS_LATITUDE'] - prev_event['GPS_LATITUDE'])
+        elif prev_event:
+            event['GPS_LONGITUDE'] = prev_event['GPS_LONGITUDE']
+            event['GPS_LATITUDE'] = prev_event['GPS_LATITUDE']
+        elif next_event:
+            event['GPS_LONGITUDE'] = next_event['GPS_LONGITUDE']
+            event['GPS_LATITUDE'] = next_event['GPS_LATITUDE']
+        else:
+            event['GPS_LONGITUDE'] = 0
+            event['GPS_LATITUDE'] = 0
 
 def compute_speeds(events):
     """Computes speeds for the breadcrumbs."""
@@ -63,10 +86,8 @@ def compute_speeds(events):
 
 def convert_breadcrumb(event, common_trip_id):
     """Converts event data into the format for the breadcrumb table."""
-    base_time = parse_date(event["OPD_DATE"])
-    full_time = base_time + timedelta(seconds=event["ACT_TIME"])
     return {
-        "tstamp": full_time.isoformat(),
+        "tstamp": to_isoformat(event["OPD_DATE"], event["ACT_TIME"]),
         "latitude": event["GPS_LATITUDE"],
         "longitude": event["GPS_LONGITUDE"],
         "speed": event["SPEED"],
@@ -93,82 +114,176 @@ def convert_trip(vehicle_id, event):
         "direction": True
     }
 
-def clean_json_files():
-    """Cleans JSON files and saves cleaned data to disk."""
-    if not os.path.exists(INPUT_FOLDER) or not os.path.isdir(INPUT_FOLDER):
-        print(f"Input directory {INPUT_FOLDER} does not exist.")
-        return
+def write_json_atomic(path, data):
+    """Writes JSON to a temp file and renames it into place, so readers never see a partial file."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as out_file:
+        json.dump(data, out_file, indent=4)
+    os.replace(temp_path, path)
 
-    if not os.path.exists(OUTPUT_FOLDER):
-        os.makedirs(OUTPUT_FOLDER)
+def clean_vehicle(file_name, vehicle_id, events, output_file_name, output_format=OUTPUT_FORMAT):
+    """Cleans one vehicle-day and saves it. Returns (output_file_name, trip_info, first breadcrumb) or None."""
+    impute_gps_coordinates(events)
+    compute_speeds(events)
 
-    already_processed = {f for f in os.listdir(OUTPUT_FOLDER) if f.endswith('.json')}
-    json_files = [f for f in os.listdir(INPUT_FOLDER) if f.endswith('.json')]
-    pbar = tqdm(json_files, desc="Cleaning JSON files", total=len(json_files))
+    # Use the first event's trip_id as the common trip_id
+    common_trip_id = events[0]["EVENT_NO_TRIP"]
 
-    first_trip_printed = False
-    first_breadcrumb_printed = False
+    breadcrumbs = [convert_breadcrumb(e, common_trip_id) for e in events]
+    if not breadcrumbs:
+        print(f"No valid breadcrumb data for {file_name}, vehicle {vehicle_id}.")
+        return None
 
-    for file_name in pbar:
-        with open(os.path.join(INPUT_FOLDER, file_name), 'r') as file:
-            data = json.load(file)
+    trip_info = convert_trip(vehicle_id, events[0])
+    output_path = os.path.join(OUTPUT_FOLDER, output_file_name)
+    if output_format == 'npz':
+        write_npz(output_path, trip_info, breadcrumbs_to_columns(breadcrumbs))
+    else:
+        write_json_atomic(output_path, {'trip_info': trip_info, 'breadcrumbs': breadcrumbs})
+    return output_file_name, trip_info, breadcrumbs[0]
 
-        for vehicle_id, events in data.items():
-            vehicle_id = int(vehicle_id)
-            if not events:
-                continue
+def manifest_path():
+    """Path of the processing manifest: beside OUTPUT_FOLDER, so the folder only ever holds cleaned files."""
+    return os.path.normpath(OUTPUT_FOLDER) + MANIFEST_SUFFIX
 
-            try:
-                opd_date = parse_date(events[0]['OPD_DATE'])
-                date_str = opd_date.strftime('%Y-%m-%d')
-                output_file_name = f"{date_str}__{vehicle_id}.json"
-            except IndexError:
-                print(f"No events available in {file_name} for vehicle {vehicle_id} to determine OPD_DATE.")
-                continue
+def clean_file(file_name, shard=None, output_format=OUTPUT_FORMAT):
+    """Cleans and saves the vehicle-days of one input file, or of one shard=(index, count) of its vehicles.
 
-            if output_file_name in already_processed:
-                pbar.set_description(f"Skipped {output_file_name} (already processed)")
-                continue
+    Returns (results of the saved vehicle-days, number skipped as already
+    processed). Parallel workers each read the file themselves and decode only
+    their own shard, so nothing is parsed or pickled in the parent.
+    """
+    results = []
+    skipped = 0
+    # Vehicles are read one at a time, so memory follows the largest vehicle rather than the whole day
+    for vehicle_id, events in iter_vehicles(os.path.join(INPUT_FOLDER, file_name), shard=shard):
+        vehicle_id = int(vehicle_id)
+        if not events:
+            continue
 
-            impute_gps_coordinates(events)
-            compute_speeds(events)
+        try:
+            opd_date = parse_date(events[0]['OPD_DATE'])
+            date_str = opd_date.strftime('%Y-%m-%d')
+            output_stem = f"{date_str}__{vehicle_id}"
+        except IndexError:
+            print(f"No events available in {file_name} for vehicle {vehicle_id} to determine OPD_DATE.")
+            continue
 
-            # Use the first event's trip_id as the common trip_id
-            common_trip_id = events[0]["EVENT_NO_TRIP"]
+        # A vehicle-day cleaned in either format counts as processed
+        if any(os.path.exists(os.path.join(OUTPUT_FOLDER, f"{output_stem}.{extension}")) for extension in OUTPUT_FORMATS):
+            skipped += 1
+            continue
+        result = clean_vehicle(file_name, vehicle_id, events, f"{output_stem}.{output_format}", output_format)
+        if result is not None:
+            results.append(result)
+    return results, skipped
 
-            breadcrumbs = [convert_breadcrumb(e, common_trip_id) for e in events]
-            if not breadcrumbs:
-                print(f"No valid breadcrumb data for {file_name}, vehicle {vehicle_id}.")
-                continue
+def remove_stale_temp_files(folder):
+    """Removes temp files (<name>.<pid>.tmp) whose writer is no longer running, leaving a concurrent run's alone."""
+    for f in os.listdir(folder):
+        if not f.endswith('.tmp'):
+            continue
+        pid = f[:-len('.tmp')].rsplit('.', 1)[-1]
+        if pid.isdigit() and psutil.pid_exists(int(pid)):
+            continue
+        try:
+            os.remove(os.path.join(folder, f))
+        except FileNotFoundError:
+            pass
+
+def clean_json_files(workers=1, output_format=OUTPUT_FORMAT):
+    """Cleans JSON files and saves cleaned data to disk.
+
+    With workers > 1, every input file is split into `workers` shards of
+    vehicles that are cleaned in a process pool. output_format picks
+    pretty-printed JSON or typed .npz columns for the cleaned files.
+    """
+    if not os.path.exists(INPUT_FOLDER) or not os.path.isdir(INPUT_FOLDER):
+        print(f"Input directory {INPUT_FOLDER} does not exist.")
+        return
+
+    if not os.path.exists(OUTPUT_FOLDER):
+        # Clearing the outputs also resets the manifest, so every input is cleaned again
+        if os.path.exists(manifest_path()):
+            os.remove(manifest_path())
+        os.makedirs(OUTPUT_FOLDER)
+
+    # Temp files left behind by a crashed run
+    remove_stale_temp_files(OUTPUT_FOLDER)
+
+    # Input files that are unchanged since they were fully processed are skipped with a stat, without opening them
+    manifest = ProcessingManifest(manifest_path())
+    input_files = [f for f in sorted(os.listdir(INPUT_FOLDER)) if f.endswith(('.json', '.json.gz'))]
+    json_files = [f for f in input_files if not manifest.is_processed(os.path.join(INPUT_FOLDER, f))]
+    if len(json_files) < len(input_files):
+        print(f"Skipping {len(input_files) - len(json_files)} unchanged input files.")
+    if not json_files:
+        manifest.close()
+        print("Saved 0 vehicle-days, skipped 0 already processed.")
+        return
+    if TESTING:
+        json_files = json_files[:1]
 
-            trip_info = convert_trip(vehicle_id, events[0])
+    pbar = tqdm(total=len(json_files), desc="Cleaning JSON files")
+    counts = {'saved': 0, 'skipped': 0}
+    printed = {'trip': False, 'breadcrumb': False}
 
-            with open(os.path.join(OUTPUT_FOLDER, output_file_name), 'w') as out_file:
-                json.dump({'trip_info': trip_info, 'breadcrumbs': breadcrumbs}, out_file, indent=4)
-                pbar.set_description(f"Saved cleaned data to {output_file_name}")
+    def report(results, skipped):
+        counts['saved'] += len(results)
+        counts['skipped'] += skipped
+        pbar.set_postfix(counts)
+        if not results:
+            return
+        output_file_name, trip_info, breadcrumb = results[0]
 
-            if not first_trip_printed:
-                trip_sql = f"INSERT INTO trip (trip_id, route_id, vehicle_id, service_key, direction) VALUES ({trip_info['trip_id']}, {trip_info['route_id']}, {trip_info['vehicle_id']}, '{trip_info['service_key']}', {trip_info['direction']});"
-                print(trip_sql)
-                first_trip_printed = True
+        if not printed['trip']:
+            trip_sql = f"INSERT INTO trip (trip_id, route_id, vehicle_id, service_key, direction) VALUES ({trip_info['trip_id']}, {trip_info['route_id']}, {trip_info['vehicle_id']}, '{trip_info['service_key']}', {trip_info['direction']});"
+            print(trip_sql)
+            printed['trip'] = True
 
-            if breadcrumbs and not first_breadcrumb_printed:
-                breadcrumb = breadcrumbs[0]
-                breadcrumb_sql = f"INSERT INTO breadcrumb (tstamp, latitude, longitude, speed, trip_id) VALUES ('{breadcrumb['tstamp']}', {breadcrumb['latitude']}, {breadcrumb['longitude']}, {breadcrumb['speed']}, {breadcrumb['trip_id']});"
-                print(breadcrumb_sql)
-                first_breadcrumb_printed = True
+        if not printed['breadcrumb']:
+            breadcrumb_sql = f"INSERT INTO breadcrumb (tstamp, latitude, longitude, speed, trip_id) VALUES ('{breadcrumb['tstamp']}', {breadcrumb['latitude']}, {breadcrumb['longitude']}, {breadcrumb['speed']}, {breadcrumb['trip_id']});"
+            print(breadcrumb_sql)
+            printed['breadcrumb'] = True
 
-            del events
-            gc.collect()
+    def file_done(file_name):
+        # Every vehicle of the file is saved (or was already), so the whole input is done
+        manifest.record(os.path.join(INPUT_FOLDER, file_name))
+        pbar.update(1)
 
-        if TESTING:
-            break
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            for file_name in json_files:
+                report(*clean_file(file_name, output_format=output_format))
+                file_done(file_name)
+        else:
+            # Only file names and shard numbers go to the workers; each returns just its results
+            futures = {executor.submit(clean_file, file_name, (index, workers), output_format): file_name
+                       for file_name in json_files for index in range(workers)}
+            shards_left = {file_name: workers for file_name in json_files}
+            for future in as_completed(futures):
+                file_name = futures[future]
+                report(*future.result())
+                shards_left[file_name] -= 1
+                if not shards_left[file_name]:
+                    file_done(file_name)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        manifest.close()
+        pbar.close()
+
+    print(f"Saved {counts['saved']} vehicle-days, skipped {counts['skipped']} already processed.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean downloaded breadcrumb JSON files.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT, help=f"Cleaned file format (default: {OUTPUT_FORMAT})")
+    args = parser.parse_args()
     try:
         log_memory_usage()
-        clean_json_files()
+        clean_json_files(workers=args.workers, output_format=args.format)
         log_memory_usage()
     except Exception as e:
         print(f"Script terminated with exception: {e}")
-
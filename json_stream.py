@@ -0,0 +1,188 @@
+import gzip
+import json
+import re
+
+# Constants
+READ_SIZE = 1 << 20  # Characters read per chunk; doubled while a single value is still incomplete
+
+GZIP_MAGIC = b'\x1f\x8b'
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')  # What can still follow the digits already read of a number
+# An array of objects with no nested arrays or objects, once every string has been emptied
+FLAT_OBJECT_ARRAY = re.compile(r'\[\s*+(?:\{[^{}\[\]]*+\}\s*+(?:,\s*+\{[^{}\[\]]*+\}\s*+)*+)?\]')
+
+
+class _StreamBuffer:
+    """Sliding text window over a file that decodes one JSON value at a time."""
+
+    def __init__(self, file, read_size):
+        self.file = file
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.text = ''
+        self.position = 0
+        self.eof = False
+
+    def _read(self, size):
+        chunk = self.file.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ('' at end of file)."""
+        while True:
+            self.position = WHITESPACE.match(self.text, self.position).end()
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self._read(self.read_size):
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.position += 1
+
+    def decode(self):
+        """Decodes the next complete JSON value, reading more of the file until it is whole."""
+        self.peek()
+        size = self.read_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.position)
+            except json.JSONDecodeError:
+                if not self._read(size):
+                    raise
+                size *= 2
+                continue
+            # A number cut by the window edge (after a digit, '.', 'e' or a sign) may continue in the next chunk
+            if (isinstance(value, (int, float)) and not self.eof
+                    and NUMBER_TAIL.match(self.text, end).end() == len(self.text) and self._read(size)):
+                continue
+            self.position = end
+            return value
+
+    def skip(self):
+        """Consumes the next value, without decoding it when it is an array with no nested arrays or escapes."""
+        end = self._array_end()
+        if end is not None:
+            value = self.text[self.position:end + 1]
+            if '\\' not in value and value.count('[') == 1:
+                self.position = end + 1
+                return
+        self.decode()
+
+    def _array_end(self):
+        """Index of the first ']' outside a string if the next value is an array, or None."""
+        if self.peek() != '[':
+            return None
+        offset, size = 1, self.read_size
+        while True:
+            end = self.text.find(']', self.position + offset)
+            if end == -1:
+                offset = len(self.text) - self.position
+                if not self._read(size):
+                    return None
+                size *= 2
+                continue
+            # An odd number of quotes before the bracket means it sits inside a string
+            if self.text.count('"', self.position, end) % 2:
+                offset = end - self.position + 1
+                continue
+            return end
+
+    def count_flat_array(self):
+        """Counts the objects in the next value without decoding it, if it is an array of flat objects.
+
+        Only string boundaries and brackets are looked at. Returns (count, length
+        in characters), or None with nothing consumed if the value has another
+        shape or contains escapes.
+        """
+        end = self._array_end()
+        if end is None:
+            return None
+        value = self.text[self.position:end + 1]
+        if '\\' in value:
+            return None
+        # Every string collapses to "" so nothing inside one can look like structure
+        outside_strings = '""'.join(value.split('"')[0::2])
+        if not FLAT_OBJECT_ARRAY.fullmatch(outside_strings):
+            return None
+        self.position = end + 1
+        return outside_strings.count('{'), len(value)
+
+
+def iter_json_object(file, read_size=READ_SIZE, shard=None):
+    """Yields the (key, value) pairs of a top-level JSON object one at a time.
+
+    Only one value is held in memory at once, so peak memory follows the
+    largest value rather than the whole file. With shard=(index, count), only
+    every count-th pair starting at index is yielded; the others are skipped
+    without being decoded where possible.
+    """
+    stream = _StreamBuffer(file, read_size)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    position = 0
+    while True:
+        key = stream.decode()
+        stream.expect(':')
+        if shard is None or position % shard[1] == shard[0]:
+            yield key, stream.decode()
+        else:
+            stream.skip()
+        position += 1
+        if stream.peek() == '}':
+            return
+        stream.expect(',')
+
+
+def open_json_text(path):
+    """Opens a day file for reading as text, decompressing it on the fly if it is gzipped.
+
+    The gzip magic bytes decide rather than the file name, so old uncompressed
+    files and compressed ones are read the same way.
+    """
+    with open(path, 'rb') as file:
+        magic = file.read(len(GZIP_MAGIC))
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_vehicles(path, read_size=READ_SIZE, shard=None):
+    """Yields (vehicle_id, events) for each vehicle in a TriMet day file, gzipped or not.
+
+    shard=(index, count) yields only that share of the vehicles, as iter_json_object does.
+    """
+    with open_json_text(path) as file:
+        yield from iter_json_object(file, read_size, shard)
+
+
+def iter_vehicle_counts(path, read_size=READ_SIZE):
+    """Yields (vehicle_id, event count, characters) for each vehicle in a day file without building the events.
+
+    Arrays of flat objects (breadcrumbs) are counted from their structure alone;
+    any other value is decoded and measured instead.
+    """
+    with open_json_text(path) as file:
+        stream = _StreamBuffer(file, read_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(':')
+            counted = stream.count_flat_array()
+            if counted is None:
+                value = stream.decode()
+                counted = (len(value) if isinstance(value, list) else 0, len(json.dumps(value)))
+            yield key, counted[0], counted[1]
+            if stream.peek() == '}':
+                return
+            stream.expect(',')
@@ -0,0 +1,214 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Constants
+BACKEND = os.environ.get('OBJECT_STORE_BACKEND', 'gcs')  # 'gcs', 'local' or 'memory'
+BUCKET_NAME = 'cs510-spring24-project1-bucket'
+BUCKET_CREDENTIALS_FILE = 'cs510-project1-6c1b06b5846a.json'
+LOCAL_STORE_ROOT = os.environ.get('LOCAL_STORE_ROOT', 'local_bucket')  # Buckets become folders under this
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Must be a multiple of 256 KB
+LARGE_OBJECT_SIZE = 64 * 1024 * 1024  # GCS objects above this are downloaded in ranged chunks
+DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # Must be a multiple of 256 KB
+HASH_CHUNK_SIZE = 1 << 20
+GZIP_LEVEL = 6
+GZIP_SUFFIX = '.gz'  # Compressed objects are stored as <name>.gz; readers sniff the gzip header, so old objects still load
+
+# What a listing returns for each object; checksums are base64 like the GCS metadata, crc32c may be None
+ObjectInfo = namedtuple('ObjectInfo', ['name', 'size', 'md5', 'crc32c'])
+
+
+def md5_base64(file):
+    """Base64 MD5 of a binary file object, read in chunks."""
+    digest = hashlib.md5()
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode('ascii')
+
+
+@lru_cache(maxsize=None)
+def gcs_client(credentials_file=None):
+    """One storage client per process and credentials file.
+
+    Anonymous when STORAGE_EMULATOR_HOST points at an emulator such as
+    fake-gcs-server, otherwise from the service account file or the default
+    application credentials.
+    """
+    from google.cloud import storage
+    if os.environ.get('STORAGE_EMULATOR_HOST'):
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(project='emulator', credentials=AnonymousCredentials())
+    if credentials_file:
+        return storage.Client.from_service_account_json(credentials_file)
+    return storage.Client()
+
+
+class GCSStore:
+    """Objects in a Google Cloud Storage bucket."""
+
+    def __init__(self, bucket_name, credentials_file=None):
+        self.client = gcs_client(credentials_file)
+        self.bucket = self.client.bucket(bucket_name)
+
+    def put_bytes(self, name, data, content_type='application/json'):
+        self.bucket.blob(name).upload_from_string(data, content_type=content_type)
+
+    @contextmanager
+    def open_write(self, name, mode='w', content_type='application/json'):
+        # Resumable upload to a partial object, renamed once complete so a failed run never replaces a good object
+        blob = self.bucket.blob(f"{name}.partial")
+        try:
+            # A BlobWriter can only upload whole chunks, so flush() is made a no-op instead of raising
+            with blob.open(mode, content_type=content_type, chunk_size=UPLOAD_CHUNK_SIZE, ignore_flush=True) as stream:
+                yield stream
+        except BaseException:
+            try:
+                blob.delete()
+            except Exception:
+                pass  # Nothing was uploaded yet
+            raise
+        self.bucket.rename_blob(blob, name)
+
+    def open_read(self, name, mode='rb'):
+        return self.bucket.blob(name).open(mode, chunk_size=DOWNLOAD_CHUNK_SIZE)
+
+    def list(self, prefix=''):
+        for blob in self.client.list_blobs(self.bucket, prefix=prefix):
+            yield ObjectInfo(blob.name, blob.size, blob.md5_hash, blob.crc32c)
+
+    def download(self, info, local_path):
+        blob = self.bucket.blob(info.name)
+        if info.size > LARGE_OBJECT_SIZE:
+            blob.chunk_size = DOWNLOAD_CHUNK_SIZE
+        blob.download_to_filename(local_path)
+
+
+class LocalStore:
+    """Objects as files under a local folder, for running the pipeline on one box."""
+
+    def __init__(self, bucket_name, root=None):
+        self.root = os.path.join(root or LOCAL_STORE_ROOT, bucket_name)
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    @contextmanager
+    def open_write(self, name, mode='w', content_type=None):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.partial"
+        try:
+            with open(temp_path, mode) as stream:
+                yield stream
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        os.replace(temp_path, path)
+
+    def put_bytes(self, name, data, content_type=None):
+        with self.open_write(name, 'wb') as stream:
+            stream.write(data)
+
+    def open_read(self, name, mode='rb'):
+        return open(self.path(name), mode)
+
+    def list(self, prefix=''):
+        for folder, _, files in os.walk(self.root):
+            for file_name in sorted(files):
+                path = os.path.join(folder, file_name)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.startswith(prefix) and not name.endswith('.partial'):
+                    with open(path, 'rb') as file:
+                        yield ObjectInfo(name, os.path.getsize(path), md5_base64(file), None)
+
+    def download(self, info, local_path):
+        shutil.copyfile(self.path(info.name), local_path)
+
+
+class MemoryStore:
+    """Objects held in a dict, for benchmarks and dry runs."""
+
+    def __init__(self, bucket_name=None):
+        self.objects = {}
+
+    @contextmanager
+    def open_write(self, name, mode='w', content_type=None):
+        stream = io.StringIO() if 'b' not in mode else io.BytesIO()
+        yield stream
+        data = stream.getvalue()
+        self.objects[name] = data.encode('utf-8') if isinstance(data, str) else data
+
+    def put_bytes(self, name, data, content_type=None):
+        self.objects[name] = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+
+    def open_read(self, name, mode='rb'):
+        data = self.objects[name]
+        return io.BytesIO(data) if 'b' in mode else io.StringIO(data.decode('utf-8'))
+
+    def list(self, prefix=''):
+        for name in sorted(self.objects):
+            if name.startswith(prefix):
+                yield ObjectInfo(name, len(self.objects[name]), md5_base64(io.BytesIO(self.objects[name])), None)
+
+    def download(self, info, local_path):
+        with open(local_path, 'wb') as file:
+            file.write(self.objects[info.name])
+
+
+BACKENDS = {'gcs': GCSStore, 'local': LocalStore, 'memory': MemoryStore}
+
+
+@lru_cache(maxsize=None)
+def get_store(bucket_name=BUCKET_NAME, backend=None, credentials_file=BUCKET_CREDENTIALS_FILE):
+    """The process-wide store for a bucket, using BACKEND unless another backend is named."""
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown object store backend: {backend}")
+    if backend == 'gcs':
+        return GCSStore(bucket_name, credentials_file)
+    return BACKENDS[backend](bucket_name)
+
+
+class _GzipWriter(gzip.GzipFile):
+    """A GzipFile whose flush() does nothing.
+
+    Closing the text layer on top flushes it, which would cut a sync-flush
+    block into the stream and flush the upload stream below, which not every
+    store's stream supports. close() still writes the rest and the trailer.
+    """
+
+    def flush(self, zlib_mode=None):
+        pass
+
+
+@contextmanager
+def _open_gzip_write(store, name):
+    with store.open_write(name, 'wb', content_type='application/gzip') as raw:
+        # mtime=0 keeps the output identical for identical input, so checksums only change with the data
+        with _GzipWriter(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) as compressed:
+            with io.TextIOWrapper(compressed, encoding='utf-8') as text:
+                yield text
+
+
+def open_text_write(store, name, compress=False):
+    """Streams text into an object, gzip-compressing it on the way (as <name>.gz) if compress is set."""
+    if compress:
+        return _open_gzip_write(store, f"{name}{GZIP_SUFFIX}")
+    return store.open_write(name, 'w', content_type='application/json')
+
+
+def put_json(store, name, data, compress=False):
+    """Uploads data as one JSON object, gzipped (as <name>.gz) if compress is set. Returns the object name."""
+    body = json.dumps(data).encode('utf-8')
+    if compress:
+        store.put_bytes(f"{name}{GZIP_SUFFIX}", gzip.compress(body, GZIP_LEVEL, mtime=0), content_type='application/gzip')
+        return f"{name}{GZIP_SUFFIX}"
+    store.put_bytes(name, body, content_type='application/json')
+    return name
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+# Constants
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProcessingManifest:
+    """SQLite record of the input files a pipeline stage has fully processed.
+
+    An input is unchanged when its size and mtime match the recorded ones, which
+    needs only a stat. If just the mtime moved (a re-download of the same bytes),
+    the content hash decides and the new mtime is stored.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_inputs (
+                file_name TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                processed_at TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+        self.entries = {row[0]: row[1:] for row in
+                        self.connection.execute("SELECT file_name, size, mtime_ns, sha256 FROM processed_inputs")}
+
+    def is_processed(self, path):
+        """Returns True if the file at path was recorded and has not changed since."""
+        entry = self.entries.get(os.path.basename(path))
+        if entry is None:
+            return False
+        size, mtime_ns, sha256 = entry
+        stat = os.stat(path)
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns == mtime_ns:
+            return True
+        if file_digest(path) != sha256:
+            return False
+        self._store(path, stat, sha256)
+        return True
+
+    def record(self, path):
+        """Marks the file at path as fully processed."""
+        self._store(path, os.stat(path), file_digest(path))
+
+    def _store(self, path, stat, sha256):
+        file_name = os.path.basename(path)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO processed_inputs (file_name, size, mtime_ns, sha256, processed_at) VALUES (?, ?, ?, ?, ?)",
+                (file_name, stat.st_size, stat.st_mtime_ns, sha256, datetime.now().isoformat())
+            )
+        self.entries[file_name] = (stat.st_size, stat.st_mtime_ns, sha256)
+
+    def close(self):
+        self.connection.close()
@@ -1,55 +1,96 @@
 import requests
-import pandas as pd
 from datetime import datetime
 from google.cloud import pubsub_v1
 import json
 import time
 from tqdm import tqdm
-from assertions import validate_data 
-from transformations import calculate_speed, decode_timestamp
+from assertions import RULE_COLUMNS, record_columns, validate_batch
+from transformations import calculate_speeds, decode_timestamps
+from vehicle_roster import get_vehicle_ids
+from breadcrumb_codec import encode_breadcrumbs
 
+# Pack many breadcrumbs of one vehicle into each message instead of one message per breadcrumb
+BATCHED = True
+BREADCRUMBS_PER_MESSAGE = 1000
+COMPRESS = True
+PUBLISH_ATTEMPTS = 3
+VALIDATION_POLICY = 'quarantine'  # 'drop', 'quarantine' or 'fail'
+QUARANTINE_FILE = 'quarantine/validation_failures.jsonl'  # Rows rejected under the 'quarantine' policy
+COLUMNS = RULE_COLUMNS + ('METERS', 'OPD_DATE')
 
-def get_vehicle_ids():
-    doc_key = "10VKMye65LhbEgMLld5Ol3lOocWUwCaEgnPVgFQf9em0"
-    url = f"https://docs.google.com/spreadsheets/d/{doc_key}/export?format=csv"
-    response = requests.get(url)
-    csv_data = response.content
-    with open("vehicle_ids_sheet.csv", "wb") as file:
-        file.write(csv_data)
-    vehicle_ids = pd.read_csv("vehicle_ids_sheet.csv")['Doodle'].tolist()
-    return vehicle_ids
+BATCH_SETTINGS = pubsub_v1.types.BatchSettings(
+    max_messages=100,
+    max_bytes=4 * 1024 * 1024,
+    max_latency=0.05,
+)
+FLOW_CONTROL = pubsub_v1.types.PublishFlowControl(
+    message_limit=1000,
+    byte_limit=64 * 1024 * 1024,
+    limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
+)
+
+
+def publish_with_retry(publisher, topic_path, messages):
+    """Publishes (data, attributes) pairs, republishing failures. Returns (published, failed) counts."""
+    published = 0
+    for attempt in range(PUBLISH_ATTEMPTS):
+        futures = [(publisher.publish(topic_path, data, **attributes), data, attributes) for data, attributes in messages]
+        messages = []
+        for future, data, attributes in futures:
+            try:
+                future.result()
+                published += 1
+            except Exception as e:
+                print(f"Publish attempt {attempt + 1} failed: {e}")
+                messages.append((data, attributes))
+        if not messages:
+            break
+    return published, len(messages)
 
 def publish_breadcrumbs():
     project_id = "cs510-project1"
     topic_id = "cs510-spring24-topic"
-    publisher = pubsub_v1.PublisherClient()
+    publisher = pubsub_v1.PublisherClient(BATCH_SETTINGS, publisher_options=pubsub_v1.types.PublisherOptions(flow_control=FLOW_CONTROL))
     topic_path = publisher.topic_path(project_id, topic_id)
 
     vehicle_ids = get_vehicle_ids()
+    published_count = 0
+    failed_count = 0
 
     for vehicle_id in tqdm(vehicle_ids, desc="Processing vehicle IDs"):
         url = f"https://busdata.cs.pdx.edu/api/getBreadCrumbs?vehicle_id={vehicle_id}"
         response = requests.get(url)
         if response.status_code == 200:
             breadcrumbs = response.json()
-            previous_breadcrumb = None
-            for breadcrumb in breadcrumbs:
-                if previous_breadcrumb is not None:
-                    speed = calculate_speed(previous_breadcrumb, breadcrumb)
-                    breadcrumb['SPEED'] = speed
-                else:
-                    breadcrumb['SPEED'] = None
-
-                timestamp = decode_timestamp(breadcrumb) 
+            # The fields the transformations and the assertions need, pulled out of the dicts once
+            columns = record_columns(breadcrumbs, COLUMNS)
+            # Speeds and timestamps for the whole vehicle in one vectorized pass
+            speeds = calculate_speeds(columns)
+            timestamps = decode_timestamps(columns)
+            for breadcrumb, speed, timestamp in zip(breadcrumbs, speeds, timestamps):
+                breadcrumb['SPEED'] = speed
                 breadcrumb['TIMESTAMP'] = timestamp
-                validate_data(breadcrumb)
-                data_str = json.dumps(breadcrumb)
-                data_bytes = data_str.encode('utf-8')
-                publisher.publish(topic_path, data_bytes)
-                previous_breadcrumb = breadcrumb
                 #print statement for testing
                 # print(breadcrumb) 
+
+            # Filter out rows that break the assertions before they reach the topic
+            breadcrumbs, violations = validate_batch(breadcrumbs, policy=VALIDATION_POLICY, columns=columns,
+                                                     quarantine_file=QUARANTINE_FILE)
+            if violations:
+                counts = ", ".join(f"{message}: {len(indexes)}" for message, indexes in violations.items())
+                print(f"Vehicle {vehicle_id} rejected rows ({counts})")
+
+            if BATCHED:
+                messages = [encode_breadcrumbs(breadcrumbs[i:i + BREADCRUMBS_PER_MESSAGE], compress=COMPRESS)
+                            for i in range(0, len(breadcrumbs), BREADCRUMBS_PER_MESSAGE)]
+            else:
+                messages = [(json.dumps(breadcrumb).encode('utf-8'), {}) for breadcrumb in breadcrumbs]
+            published, failed = publish_with_retry(publisher, topic_path, messages)
+            published_count += published
+            failed_count += failed
         time.sleep(1)  # Respectful delay to avoid rate limiting
 
+    print(f"Published {published_count} messages, {failed_count} failed after {PUBLISH_ATTEMPTS} attempts")
+
 if __name__ == "__main__":
     publish_breadcrumbs()
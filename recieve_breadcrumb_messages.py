@@ -1,11 +1,12 @@
 import google.cloud.pubsub_v1 as pubsub_v1
-from google.cloud import storage
-import json
 import google.cloud.logging
 from google.cloud.logging.handlers import CloudLoggingHandler
 import logging
 import sys
 from datetime import datetime
+from breadcrumb_spill import SpillBuffer, SPILL_MAX_MESSAGES, collection_day
+from breadcrumb_codec import decode_message
+from object_store import get_store, open_text_write, put_json
 
 # Inline argument which gives receiver a title for logging
 instance_id = sys.argv[1] if len(sys.argv) > 1 else "CronJob Receiver"
@@ -21,20 +22,32 @@ cloud_logger = logging.getLogger('cloudLogger')
 cloud_logger.setLevel(logging.INFO)
 cloud_logger.addHandler(handler)
 
-# Prepare storage client
-storage_client = storage.Client()
-bucket = storage_client.bucket('cs510-spring24-project1-bucket')
+# Object store for the bucket, using the default application credentials
+store = get_store(credentials_file=None)
+
+# Spill sorted runs to local disk instead of holding the whole day in memory
+SPILL_TO_DISK = True
+# Gzip the day file on upload (stored as <filename>.gz)
+COMPRESS_SNAPSHOTS = True
 
 # Temporary storage for messages
 messages = []
+spill_buffer = SpillBuffer() if SPILL_TO_DISK else None
+received_count = 0
 
 def callback(message):
-    message_data = json.loads(message.data.decode('utf-8'))
-    messages.append(message_data)
-    message.ack()  # Acknowledge the message
-    
-    if len(messages) % 1000 == 0:
-        print(f"{instance_id}: Processed {len(messages)} messages.", end='\r', flush=True)
+    global received_count
+    # A message holds either one breadcrumb or a packed batch of them
+    message_data = decode_message(message.data, message.attributes)
+    if SPILL_TO_DISK:
+        spill_buffer.add(message, message_data)  # Acknowledged once spilled to disk
+    else:
+        messages.extend(message_data)
+        message.ack()  # Acknowledge the message
+
+    received_count += len(message_data)
+    if received_count // 1000 != (received_count - len(message_data)) // 1000:
+        print(f"{instance_id}: Processed {received_count} messages.", end='\r', flush=True)
 
 
 def sort_and_store_messages():
@@ -64,17 +77,50 @@ def sort_and_store_messages():
     folder_name = "data_via_topic"
 
     # Save all messages as a single JSON object indexed by sorted 'VEHICLE_ID'
-    blob = bucket.blob(f"{folder_name}/{filename}")
-    blob.upload_from_string(json.dumps(sorted_grouped_messages), content_type='application/json')
+    put_json(store, f"{folder_name}/{filename}", sorted_grouped_messages, compress=COMPRESS_SNAPSHOTS)
     cloud_logger.info(f"All messages processed and saved to GCS. Filename: {filename}, Total vehicles processed: {len(sorted_grouped_messages)}.")
 
 
 
-streaming_pull_future = subscriber.subscribe(subscription_path, callback=callback)
+def merge_and_store_spilled_messages(day):
+    filename = f"TriMet__{day}.json"
+    folder_name = "data_via_topic"
+
+    # Stream the k-way merge of the day's sorted runs into a partial object, then rename it into place
+    with open_text_write(store, f"{folder_name}/{filename}", compress=COMPRESS_SNAPSHOTS) as stream:
+        vehicle_count = spill_buffer.merge(stream, day)
+    spill_buffer.clear(day)
+    cloud_logger.info(f"All messages processed and saved to GCS. Filename: {filename}, Total vehicles processed: {vehicle_count}.")
+
+
+def store_spilled_days():
+    spill_buffer.flush()
+    days = spill_buffer.days()
+    if not days:
+        cloud_logger.debug("No messages to process.")
+    for day in days:
+        merge_and_store_spilled_messages(day)
+
+
+if SPILL_TO_DISK:
+    # Runs an earlier crash left behind for a previous day go into that day's file before anything new arrives;
+    # today's are kept and merged with this run's messages
+    for day in spill_buffer.days():
+        if day != collection_day():
+            merge_and_store_spilled_messages(day)
+
+# Unacknowledged messages are held until they are spilled, so flow control must allow a full spill batch
+flow_control = pubsub_v1.types.FlowControl(max_messages=2 * SPILL_MAX_MESSAGES)
+streaming_pull_future = subscriber.subscribe(subscription_path, callback=callback, flow_control=flow_control)
 print(f"Listening for messages on {subscription_path}..")
 
 try:
     streaming_pull_future.result(timeout=150)  # Extended timeout to ensure all messages are received
 except TimeoutError:
-    streaming_pull_future.cancel()
-    sort_and_store_messages()
+    if SPILL_TO_DISK:
+        spill_buffer.close()  # Acknowledge everything received before the stream shuts down
+        streaming_pull_future.cancel()
+        store_spilled_days()
+    else:
+        streaming_pull_future.cancel()
+        sort_and_store_messages()
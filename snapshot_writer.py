@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import tempfile
+
+
+class SnapshotWriter:
+    """Streams a {vehicle_id: payload} JSON object to a text stream in vehicle-ID order.
+
+    Payloads are written as soon as every smaller vehicle ID has been written.
+    Payloads that arrive early are spooled to a temporary directory until their
+    turn comes, so memory stays bounded by a single vehicle's payload.
+    """
+
+    def __init__(self, stream, vehicle_ids, spool_dir=None):
+        self.stream = stream
+        self.order = sorted(set(vehicle_ids))
+        self.position = 0
+        self.spooled = set()
+        self.spool_dir = tempfile.mkdtemp(prefix="snapshot_spool_", dir=spool_dir)
+        self.stream.write("{")
+
+    def add(self, vehicle_id, payload):
+        """Adds one vehicle's payload, writing it now or spooling it until its turn."""
+        self.add_serialized(vehicle_id, json.dumps(payload))
+
+    def add_serialized(self, vehicle_id, text):
+        """Adds one vehicle's payload that is already encoded as JSON text."""
+        if self.position < len(self.order) and vehicle_id == self.order[self.position]:
+            self._write(vehicle_id, text)
+            self._drain()
+        else:
+            with open(self._spool_path(vehicle_id), "w") as file:
+                file.write(text)
+            self.spooled.add(vehicle_id)
+
+    def close(self):
+        """Writes any vehicles that never arrived as empty lists and closes the object."""
+        while self.position < len(self.order):
+            vehicle_id = self.order[self.position]
+            if vehicle_id not in self.spooled:
+                self._write(vehicle_id, "[]")
+            self._drain()
+        self.stream.write("}")
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def _spool_path(self, vehicle_id):
+        return os.path.join(self.spool_dir, f"{vehicle_id}.json")
+
+    def _write(self, vehicle_id, text):
+        if self.position > 0:
+            self.stream.write(", ")
+        self.stream.write(f"{json.dumps(str(vehicle_id))}: ")
+        self.stream.write(text)
+        self.position += 1
+
+    def _drain(self):
+        while self.position < len(self.order) and self.order[self.position] in self.spooled:
+            vehicle_id = self.order[self.position]
+            path = self._spool_path(vehicle_id)
+            with open(path, "r") as file:
+                self._write(vehicle_id, file.read())
+            os.remove(path)
+            self.spooled.discard(vehicle_id)
+
+
+def write_snapshot(stream, vehicle_ids, results, spool_dir=None, serialized=False):
+    """Writes (vehicle_id, payload) results to `stream` as one JSON object sorted by vehicle ID.
+
+    With `serialized` set, each payload is taken to be JSON text already. A None
+    payload (a failed fetch) is written as an empty list, like a missing vehicle.
+    """
+    writer = SnapshotWriter(stream, vehicle_ids, spool_dir=spool_dir)
+    add = writer.add_serialized if serialized else writer.add
+    try:
+        for vehicle_id, payload in results:
+            if payload is not None:
+                add(vehicle_id, payload)
+        writer.close()
+    except BaseException:
+        shutil.rmtree(writer.spool_dir, ignore_errors=True)
+        raise
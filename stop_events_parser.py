@@ -0,0 +1,92 @@
+from html.parser import HTMLParser
+
+
+class StopEventsParser(HTMLParser):
+    """Event-based parser for the getStopEvents HTML page.
+
+    Each <h2> names a trip and the next <table> holds its stop events. The first
+    row of that table is the header row; every later row becomes a dict keyed
+    by the table's <th> headings. Feed the page in one piece or in chunks and
+    read the result from `trips`.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.trips = []
+        self.awaiting_table = []
+        self.h2_text = None
+        self.table = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "h2":
+            self.h2_text = []
+        elif tag == "table" and self.table is None:
+            self.table = {"owners": self.awaiting_table, "headings": [], "rows": [], "row": None, "row_count": 0}
+            self.awaiting_table = []
+        elif self.table is not None:
+            if tag == "tr":
+                self._end_row()
+                self.table["row_count"] += 1
+                self.table["row"] = []
+            elif tag in ("th", "td"):
+                self._end_cell()
+                self.cell = (tag, [])
+
+    def handle_endtag(self, tag):
+        if tag == "h2" and self.h2_text is not None:
+            trip = {"trip": "".join(self.h2_text).strip(), "data": []}
+            self.trips.append(trip)
+            self.awaiting_table.append(trip)
+            self.h2_text = None
+        elif self.table is not None:
+            if tag in ("th", "td"):
+                self._end_cell()
+            elif tag == "tr":
+                self._end_row()
+            elif tag == "table":
+                self._end_table()
+
+    def handle_data(self, data):
+        if self.h2_text is not None:
+            self.h2_text.append(data)
+        if self.cell is not None:
+            self.cell[1].append(data)
+
+    def close(self):
+        super().close()
+        if self.table is not None:
+            self._end_table()
+
+    def _end_cell(self):
+        if self.cell is None:
+            return
+        tag, parts = self.cell
+        text = "".join(parts)
+        if tag == "th":
+            self.table["headings"].append(text)
+        elif self.table["row"] is not None and self.table["row_count"] > 1:
+            self.table["row"].append(text)
+        self.cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self.table["row"] is not None and self.table["row_count"] > 1:
+            self.table["rows"].append(self.table["row"])
+        self.table["row"] = None
+
+    def _end_table(self):
+        self._end_row()
+        headings = self.table["headings"]
+        rows = [dict(zip(headings, row)) for row in self.table["rows"]]
+        for trip in self.table["owners"]:
+            trip["data"] = rows if trip is self.table["owners"][0] else [dict(row) for row in rows]
+        self.table = None
+
+
+def parse_stop_events(html_text):
+    """Parses a stop events page into a list of {'trip': name, 'data': [row dicts]}."""
+    parser = StopEventsParser()
+    parser.feed(html_text)
+    parser.close()
+    return parser.trips
@@ -0,0 +1,64 @@
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+# Constants
+OPD_DATE_FORMAT = '%d%b%Y:%H:%M:%S'
+DATE_CACHE_SIZE = 32  # Distinct OPD_DATE strings kept parsed; a day file normally has one
+DAY_CACHE_SIZE = 64  # Distinct calendar days kept formatted; trips past midnight add one more
+SECONDS_PER_DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+# 'HH:MM:' for every minute of the day and 'SS' for every second, so a row is three lookups
+HOUR_MINUTES = [f"{hour:02d}:{minute:02d}:" for hour in range(24) for minute in range(60)]
+SECONDS = [f"{second:02d}" for second in range(60)]
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_opd_date(opd_date):
+    """Parses an OPD_DATE string into a datetime, once per distinct string."""
+    return datetime.strptime(opd_date, OPD_DATE_FORMAT)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def opd_date_epoch(opd_date):
+    """Seconds since 1970-01-01 for an OPD_DATE (naive local time, like the rest of the pipeline)."""
+    return (parse_opd_date(opd_date) - EPOCH) // timedelta(seconds=1)
+
+
+@lru_cache(maxsize=DAY_CACHE_SIZE)
+def _day_prefix(day, sep):
+    """'YYYY-MM-DD' plus the separator for a day number counted from the epoch."""
+    return date.fromordinal(EPOCH_ORDINAL + day).isoformat() + sep
+
+
+def to_epoch(opd_date, act_time):
+    """Seconds since the epoch for one OPD_DATE/ACT_TIME pair."""
+    return opd_date_epoch(opd_date) + act_time
+
+
+def epoch_to_isoformat(epoch, sep='T'):
+    """Formats epoch seconds like datetime.isoformat, building only the time of day per row."""
+    if type(epoch) is not int:
+        if not float(epoch).is_integer():
+            # Fractional seconds keep datetime's microsecond formatting
+            return (EPOCH + timedelta(seconds=epoch)).isoformat(sep)
+        epoch = int(epoch)
+    day, seconds = divmod(epoch, SECONDS_PER_DAY)
+    minutes, seconds = divmod(seconds, 60)
+    return _day_prefix(day, sep) + HOUR_MINUTES[minutes] + SECONDS[seconds]
+
+
+def to_isoformat(opd_date, act_time, sep='T'):
+    """ISO timestamp for one OPD_DATE/ACT_TIME pair."""
+    return epoch_to_isoformat(opd_date_epoch(opd_date) + act_time, sep)
+
+
+def decode_epochs(opd_dates, act_times):
+    """Epoch seconds for parallel sequences of OPD_DATE strings and ACT_TIME seconds (None where ACT_TIME is missing)."""
+    return [None if act_time is None else opd_date_epoch(opd_date) + act_time
+            for opd_date, act_time in zip(opd_dates, act_times)]
+
+
+def decode_isoformats(opd_dates, act_times, sep='T'):
+    """ISO timestamps for parallel sequences of OPD_DATE strings and ACT_TIME seconds."""
+    return [None if epoch is None else epoch_to_isoformat(epoch, sep) for epoch in decode_epochs(opd_dates, act_times)]
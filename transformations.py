@@ -1,14 +1,47 @@
-from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
+from timestamp_decoder import decode_isoformats, to_isoformat
+
+def to_frame(breadcrumbs, columns):
+    """Returns the given columns of a breadcrumb list (or an existing DataFrame) as a DataFrame."""
+    if isinstance(breadcrumbs, pd.DataFrame):
+        return breadcrumbs[columns]
+    return pd.DataFrame.from_records(breadcrumbs, columns=columns)
+
+def calculate_speeds(breadcrumbs):
+    """Speeds (meters/second) for a whole vehicle's breadcrumbs in one pass. The first one is None.
+
+    Takes a breadcrumb list, a DataFrame or a {name: values} mapping of columns.
+    """
+    # A mapping's rows are counted from a column, since len() of it counts its fields
+    if len(breadcrumbs['METERS'] if isinstance(breadcrumbs, dict) else breadcrumbs) == 0:
+        return []
+    if not isinstance(breadcrumbs, dict):
+        breadcrumbs = to_frame(breadcrumbs, ['METERS', 'ACT_TIME'])
+    distance = np.diff(np.asarray(breadcrumbs['METERS'], dtype=float))
+    time_difference = np.diff(np.asarray(breadcrumbs['ACT_TIME'], dtype=float))
+    speeds = np.divide(distance, time_difference, out=np.zeros_like(distance), where=time_difference != 0)
+    return [None] + speeds.tolist()
+
+def decode_timestamps(breadcrumbs):
+    """Timestamps (OPD_DATE + ACT_TIME seconds) for a whole vehicle's breadcrumbs in one pass.
+
+    Takes a breadcrumb list, a DataFrame or a {name: values} mapping of columns.
+    """
+    if len(breadcrumbs) == 0:
+        return []
+    if isinstance(breadcrumbs, dict):
+        opd_dates, act_times = breadcrumbs['OPD_DATE'], breadcrumbs['ACT_TIME']
+    elif isinstance(breadcrumbs, pd.DataFrame):
+        opd_dates, act_times = breadcrumbs['OPD_DATE'].tolist(), breadcrumbs['ACT_TIME'].tolist()
+    else:
+        opd_dates = [breadcrumb['OPD_DATE'] for breadcrumb in breadcrumbs]
+        act_times = [breadcrumb['ACT_TIME'] for breadcrumb in breadcrumbs]
+    # Each distinct OPD_DATE is parsed once; sep=' ' keeps the str(pd.Timestamp) format
+    return decode_isoformats(opd_dates, act_times, sep=' ')
 
 def calculate_speed(previous_breadcrumb, current_breadcrumb):
-    distance = current_breadcrumb['METERS'] - previous_breadcrumb['METERS']
-    time_difference = current_breadcrumb['ACT_TIME'] - previous_breadcrumb['ACT_TIME']
-    speed = distance / time_difference if time_difference != 0 else 0
-    return speed
+    return calculate_speeds([previous_breadcrumb, current_breadcrumb])[1]
 
 def decode_timestamp(breadcrumb):
-    opd_date = pd.to_datetime(breadcrumb['OPD_DATE'],format='%d%b%Y:%H:%M:%S')
-    timestamp = opd_date + pd.to_timedelta(breadcrumb['ACT_TIME'], unit='s')
-    return str(timestamp)
-
+    return to_isoformat(breadcrumb['OPD_DATE'], breadcrumb['ACT_TIME'], sep=' ')
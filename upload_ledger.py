@@ -0,0 +1,118 @@
+import os
+from psycopg2.extras import execute_values
+from processing_manifest import file_digest
+
+# Record of the files each uploader has loaded, kept in the database so it commits with the data
+LEDGER_TABLE = 'upload_ledger'
+MIGRATED_SUFFIX = '.migrated'
+
+
+def prepare_ledger(conn, loader, history_file=None):
+    """Creates the ledger table if needed and moves an old upload history text file into it.
+
+    Migrated entries have no size or hash and count as loaded whatever the
+    file now holds. The text file is renamed only after the commit, so a
+    failed migration is simply retried. Returns the number of migrated names.
+    """
+    with conn.cursor() as cursor:
+        # CREATE TABLE IF NOT EXISTS can still collide when two first runs start together
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (LEDGER_TABLE,))
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+                loader text NOT NULL,
+                file_name text NOT NULL,
+                size bigint,
+                mtime_ns bigint,
+                sha256 text,
+                loaded_at timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (loader, file_name)
+            )
+            """
+        )
+        names = set()
+        if history_file and os.path.exists(history_file):
+            with open(history_file, 'r') as file:
+                names = {os.path.basename(line.strip()) for line in file if line.strip()}
+            execute_values(
+                cursor,
+                f"INSERT INTO {LEDGER_TABLE} (loader, file_name) VALUES %s ON CONFLICT (loader, file_name) DO NOTHING",
+                [(loader, name) for name in names]
+            )
+    conn.commit()
+    if names:
+        os.replace(history_file, history_file + MIGRATED_SUFFIX)
+    return len(names)
+
+
+def pending_files(cursor, loader, filepaths):
+    """Returns the filepaths that are not in the ledger, or whose contents changed since they were loaded.
+
+    Only the ledger rows for these names are fetched, by primary key. A file
+    whose size and mtime match is not read; if only the mtime moved, the
+    content hash decides and the new mtime is stored.
+    """
+    names = {os.path.basename(filepath): filepath for filepath in filepaths}
+    cursor.execute(
+        f"SELECT file_name, size, mtime_ns, sha256 FROM {LEDGER_TABLE} WHERE loader = %s AND file_name = ANY(%s)",
+        (loader, list(names))
+    )
+    entries = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    pending = []
+    touched = []
+    for name, filepath in names.items():
+        entry = entries.get(name)
+        if entry is None:
+            pending.append(filepath)
+            continue
+        size, mtime_ns, sha256 = entry
+        if sha256 is None:
+            continue  # Migrated from a history file
+        stat = os.stat(filepath)
+        if stat.st_size != size:
+            pending.append(filepath)
+        elif stat.st_mtime_ns != mtime_ns:
+            if file_digest(filepath) == sha256:
+                touched.append((loader, name, stat.st_mtime_ns))
+            else:
+                pending.append(filepath)
+    if touched:
+        execute_values(
+            cursor,
+            f"UPDATE {LEDGER_TABLE} AS l SET mtime_ns = t.mtime_ns FROM (VALUES %s) AS t (loader, file_name, mtime_ns) "
+            "WHERE l.loader = t.loader AND l.file_name = t.file_name",
+            touched
+        )
+    pending = set(pending)
+    return [filepath for filepath in filepaths if filepath in pending]
+
+
+def claim_files(cursor, loader, filepaths):
+    """Records filepaths as loaded, in the caller's transaction. Returns the ones this transaction claimed.
+
+    A file already recorded with the same contents is not claimed, so if two
+    runs race for a file the second waits on the first's row lock and then
+    skips it. Call this before writing the data and load only what it returns.
+    """
+    rows = []
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        rows.append((loader, os.path.basename(filepath), stat.st_size, stat.st_mtime_ns, file_digest(filepath)))
+    if not rows:
+        return []
+    claimed = execute_values(
+        cursor,
+        f"""
+        INSERT INTO {LEDGER_TABLE} (loader, file_name, size, mtime_ns, sha256) VALUES %s
+        ON CONFLICT (loader, file_name) DO UPDATE
+        SET size = EXCLUDED.size, mtime_ns = EXCLUDED.mtime_ns, sha256 = EXCLUDED.sha256, loaded_at = now()
+        WHERE {LEDGER_TABLE}.sha256 IS DISTINCT FROM EXCLUDED.sha256 AND {LEDGER_TABLE}.sha256 IS NOT NULL
+        RETURNING file_name
+        """,
+        rows,
+        page_size=len(rows),
+        fetch=True
+    )
+    claimed = {name for (name,) in claimed}
+    return [filepath for filepath in filepaths if os.path.basename(filepath) in claimed]
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import os
+import time
+
+import requests
+
+# Constants
+DOC_KEY = "10VKMye65LhbEgMLld5Ol3lOocWUwCaEgnPVgFQf9em0"
+ROSTER_URL = f"https://docs.google.com/spreadsheets/d/{DOC_KEY}/export?format=csv"
+ROSTER_COLUMN = "Doodle"
+CACHE_FILE = "vehicle_ids_sheet.csv"
+CACHE_META_FILE = "vehicle_ids_sheet.meta.json"
+CACHE_TTL = 6 * 60 * 60  # Seconds before the cached sheet is revalidated
+REQUEST_TIMEOUT = 30
+
+
+def parse_vehicle_ids(csv_text):
+    """Parses the vehicle IDs out of the roster sheet's CSV export."""
+    reader = csv.DictReader(io.StringIO(csv_text))
+    if reader.fieldnames is None or ROSTER_COLUMN not in reader.fieldnames:
+        raise ValueError(f"Roster sheet has no '{ROSTER_COLUMN}' column")
+    return [int(float(row[ROSTER_COLUMN])) for row in reader if row[ROSTER_COLUMN] and row[ROSTER_COLUMN].strip()]
+
+
+def load_cache_meta():
+    """Loads the validators and fetch time recorded for the cached sheet."""
+    try:
+        with open(CACHE_META_FILE, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_atomic(path, content):
+    """Writes `content` to a temp file and renames it over `path`."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+
+def read_cached_vehicle_ids():
+    with open(CACHE_FILE, "r", encoding="utf-8") as file:
+        return parse_vehicle_ids(file.read())
+
+
+def get_vehicle_ids(ttl=CACHE_TTL):
+    """Returns the vehicle roster, using the on-disk cache while it is fresh.
+
+    A stale cache is revalidated with ETag / If-Modified-Since. If the sheet
+    cannot be fetched, the last good copy is used instead.
+    """
+    meta = load_cache_meta()
+    cached = os.path.exists(CACHE_FILE)
+    if cached and time.time() - meta.get("fetched_at", 0) < ttl:
+        return read_cached_vehicle_ids()
+
+    headers = {}
+    if cached and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if cached and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = requests.get(ROSTER_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            meta["fetched_at"] = time.time()
+            write_atomic(CACHE_META_FILE, json.dumps(meta))
+            return read_cached_vehicle_ids()
+        response.raise_for_status()
+        csv_text = response.content.decode("utf-8-sig")
+        vehicle_ids = parse_vehicle_ids(csv_text)
+    except (requests.RequestException, ValueError) as e:
+        if not cached:
+            raise
+        print(f"Failed to refresh vehicle roster ({e}); using cached copy from {CACHE_FILE}")
+        return read_cached_vehicle_ids()
+
+    write_atomic(CACHE_FILE, csv_text)
+    write_atomic(CACHE_META_FILE, json.dumps({
+        "fetched_at": time.time(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }))
+    return vehicle_ids